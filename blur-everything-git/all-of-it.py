@@ -1,42 +1,1025 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
 import cv2
 import numpy as np
 import os
 import zipfile
-import shutil
+import io
 import logging
-import face_recognition
+import queue
+import threading
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter, OrderedDict, deque
+import importlib
+import hashlib
+import json
+import re
+import shutil
+import tempfile
+import contextlib
+import uuid
+import weakref
+import sys
+import atexit
+import pickle
+import subprocess
+import cProfile
+import pstats
 import fitz
 import spacy
 from pytube import YouTube
 import requests
 from urllib.error import HTTPError
+from werkzeug.serving import is_running_from_reloader
 
 app = Flask(__name__)
 
 logging.basicConfig(level=logging.INFO)
-nlp = spacy.load("en_core_web_sm")
+
+# Number of processes used for per-frame detection in the video routes; can be
+# overridden per request with the "workers" field.
+FRAME_WORKERS = int(os.environ.get('BLUR_FRAME_WORKERS', '1'))
+
+# Idle video worker pools kept for later requests with the same task, options
+# and worker count. Each one holds its processes, their models and its shared
+# memory slots.
+FRAME_POOL_LIMIT = int(os.environ.get('BLUR_FRAME_POOLS', '2'))
+
+# Number of images of an uploaded zip processed at once by the picture routes:
+# threads, or processes for the face_recognition-based person route; can be
+# overridden per request with the "workers" field.
+IMAGE_WORKERS = int(os.environ.get('BLUR_IMAGE_WORKERS', str(os.cpu_count() or 1)))
+
+# Number of images or frames sent through the face detector in one forward
+# pass; can be overridden per request with the "batch_size" field.
+FACE_BATCH_SIZE = int(os.environ.get('BLUR_FACE_BATCH_SIZE', '8'))
+
+# Run the detector on every Nth video frame and track boxes in between
+# (1 = detect on every frame); can be overridden with "detect_every". Tracking
+# falls back to detection when fewer than TRACK_MIN_CONFIDENCE of a box's
+# feature points survive the forward-backward optical flow check.
+DETECT_EVERY = int(os.environ.get('BLUR_DETECT_EVERY', '1'))
+TRACK_MIN_CONFIDENCE = float(os.environ.get('BLUR_TRACK_MIN_CONFIDENCE', '0.5'))
+
+# Scene-aware detection: a video frame reuses the boxes found for an earlier
+# frame when no part of the image has changed by more than
+# BLUR_STATIC_THRESHOLD grey levels since (0 disables it; can be overridden
+# with "static_threshold"). A frame that differs on average by more than
+# BLUR_SCENE_CUT_THRESHOLD grey levels from the previous one is a scene cut and
+# always goes through full detection.
+STATIC_THRESHOLD = float(os.environ.get('BLUR_STATIC_THRESHOLD', '0'))
+SCENE_CUT_THRESHOLD = float(os.environ.get('BLUR_SCENE_CUT_THRESHOLD', '30'))
+
+# Registered reference person profiles and the per-image encoding cache.
+PROFILES_DIR = os.environ.get('BLUR_PROFILES_DIR', 'profiles')
+
+# Face distance at or below which a face matches a known identity (the
+# face_recognition default), and the gallery size from which matching goes
+# through the approximate inverted-file index (0 disables it) along with the
+# number of index buckets searched per face.
+MATCH_TOLERANCE = float(os.environ.get('BLUR_MATCH_TOLERANCE', '0.6'))
+ANN_MIN_GALLERY = int(os.environ.get('BLUR_ANN_MIN_GALLERY', '5000'))
+ANN_PROBES = int(os.environ.get('BLUR_ANN_PROBES', '8'))
+
+# Scale at which face_recognition's HOG detector looks for faces in the person
+# routes (1.0 = full resolution); can be overridden with "detection_scale".
+PERSON_DETECTION_SCALE = float(os.environ.get('BLUR_PERSON_DETECTION_SCALE', '1.0'))
+
+# Number of processes used to redact a large PDF in page ranges, and the page
+# count from which a document is split at all; the process count can be
+# overridden per request with the "workers" field.
+PDF_WORKERS = int(os.environ.get('BLUR_PDF_WORKERS', '1'))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('BLUR_PDF_PARALLEL_MIN_PAGES', '200'))
+PDF_MIN_RANGE_PAGES = 25
+
+# Every request or job works in its own directory under this root, so
+# concurrent requests never share file paths.
+WORKSPACE_ROOT = os.environ.get('BLUR_WORKSPACE_DIR', 'downloads')
+
+# Finished outputs are cached on disk keyed by the content of their inputs,
+# the operation and its parameters; least recently used entries are evicted
+# once the cache grows past BLUR_RESULT_CACHE_MAX_BYTES (0 disables caching).
+RESULT_CACHE_DIR = os.environ.get('BLUR_RESULT_CACHE_DIR', 'result-cache')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('BLUR_RESULT_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# Requests sent with "profile" set are profiled. Video profiles are written to
+# the job's directory next to its output, others to a directory of their own
+# under BLUR_PROFILE_DIR. Thread stacks are sampled every
+# BLUR_PROFILE_SAMPLE_INTERVAL seconds for the flame graph.
+PROFILE_DIR = os.environ.get('BLUR_PROFILE_DIR', 'request-profiles')
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('BLUR_PROFILE_SAMPLE_INTERVAL', '0.005'))
+
+# Video encoder: "ffmpeg" pipes raw frames to an ffmpeg subprocess, "opencv"
+# writes mp4v through cv2.VideoWriter and drops the audio, "auto" uses ffmpeg
+# when it is installed. The codec, CRF and preset apply to ffmpeg and can be
+# overridden with "encoder", "codec", "crf" and "preset". The source frame rate
+# is kept; DEFAULT_FPS is used when the source does not report one.
+VIDEO_ENCODER = os.environ.get('BLUR_VIDEO_ENCODER', 'auto')
+FFMPEG_BINARY = os.environ.get('BLUR_FFMPEG', 'ffmpeg')
+VIDEO_CODEC = os.environ.get('BLUR_VIDEO_CODEC', 'libx264')
+VIDEO_CRF = int(os.environ.get('BLUR_VIDEO_CRF', '23'))
+VIDEO_PRESET = os.environ.get('BLUR_VIDEO_PRESET', 'veryfast')
+DEFAULT_FPS = 30.0
+
+# Tiled face detection for large images: besides the whole frame, the SSD sees
+# overlapping BLUR_DETECTION_TILE-pixel tiles of the frame at full resolution
+# and at every halving of it, BLUR_TILE_BATCH_SIZE tiles per forward pass, so
+# small faces reach it at their native size; can be switched on per request
+# with "tiled".
+TILED_DETECTION = os.environ.get('BLUR_TILED_DETECTION', '0') == '1'
+DETECTION_TILE = int(os.environ.get('BLUR_DETECTION_TILE', '300'))
+TILE_BATCH_SIZE = int(os.environ.get('BLUR_TILE_BATCH_SIZE', '32'))
+TILE_OVERLAP = 0.25
+NMS_THRESHOLD = 0.3
+
+# Where the eye routes look for eyes: "frame" scans the whole frame with the
+# Haar cascade, "faces" scans only the upper part of each face found by the
+# DNN face detector, "geometry" blurs the eye band of each face without
+# running the cascade; can be overridden with "eye_mode".
+EYE_MODE = os.environ.get('BLUR_EYE_MODE', 'frame')
+
+# Default anonymization kernel (gaussian, pixelate, downsample, box or fill)
+# and whether overlapping boxes are merged into one mask before anonymizing;
+# can be overridden with "kernel" and "merge_boxes".
+ANONYMIZE_KERNEL = os.environ.get('BLUR_KERNEL', 'gaussian')
+MERGE_BOXES = os.environ.get('BLUR_MERGE_BOXES', '0') == '1'
 
 # Utility functions
-def extract_zip(zip_path, extract_to):
+# In-memory zip handling: images are decoded straight from the uploaded
+# archive, encoded with cv2.imencode, and the result zip is streamed to the
+# client entry by entry while it is being built.
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png')
+
+def open_zip_upload(upload, metrics=None):
+    # The upload is read into memory up front: the request stream is closed
+    # before a streamed response finishes.
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to)
+        data = upload.read()
+        if metrics is not None:
+            metrics.add_bytes('in', len(data))
+        return zipfile.ZipFile(io.BytesIO(data))
     except Exception as e:
-        logging.error(f"An error occurred while extracting the zip file: {str(e)}")
+        logging.error(f"An error occurred while opening the zip file: {str(e)}")
         raise
 
-def zip_files(input_folder, output_zip):
+def zip_image_infos(archive):
+    return [info for info in archive.infolist()
+            if not info.is_dir() and info.filename.endswith(IMAGE_EXTENSIONS)]
+
+def iter_zip_entries(archive):
+    for info in zip_image_infos(archive):
+        yield info.filename, archive.read(info)
+
+def decode_image(file_name, data):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        logging.warning(f"Skipping {file_name}: not a readable image")
+    return image
+
+def encode_image(image, ext):
+    ok, buffer = cv2.imencode(ext, image)
+    if not ok:
+        raise Exception(f"Failed to encode image as {ext}")
+    return buffer.tobytes()
+
+class _ZipStreamBuffer:
+    # Write-only sink for zipfile; having no tell() makes zipfile write a
+    # streamable archive with data descriptors.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_zip(entries, metrics=None):
+    buffer = _ZipStreamBuffer()
     try:
-        with zipfile.ZipFile(output_zip, 'w') as zipf:
-            for root, dirs, files in os.walk(input_folder):
-                for file in files:
-                    zipf.write(os.path.join(root, file),
-                               os.path.relpath(os.path.join(root, file),
-                                               os.path.join(input_folder, '..')))
+        with zipfile.ZipFile(buffer, 'w') as zipf:
+            for arcname, data in entries:
+                started = time.perf_counter()
+                zipf.writestr(arcname, data)
+                chunk = buffer.drain()
+                if metrics is not None:
+                    metrics.add_time('zip', time.perf_counter() - started)
+                    metrics.add_bytes('out', len(chunk))
+                yield chunk
+        chunk = buffer.drain()
+        if metrics is not None:
+            metrics.add_bytes('out', len(chunk))
+        yield chunk
     except Exception as e:
-        logging.error(f"An error occurred while zipping files: {str(e)}")
+        logging.error(f"An error occurred while streaming the zip file: {str(e)}")
+        raise
+
+def zip_response(entries, download_name='blurred_images.zip', cache_key=None, metrics=None, profiler=None):
+    headers = {'Content-Disposition': f'attachment; filename={download_name}'}
+    chunks = stream_zip(entries, metrics)
+    if cache_key:
+        chunks = result_cache.tee(cache_key, chunks)
+    if profiler is not None:
+        chunks = _finish_profile_after(chunks, profiler)
+        headers['X-Profile-Dir'] = profiler.output_dir
+    if metrics is not None:
+        chunks = _finish_metrics_after(chunks, metrics)
+    # The first chunk is produced before the response starts, so setup errors
+    # (a missing model, a dead worker pool, a failing first batch) reach the
+    # route's except and become a 500 instead of a cut-off 200 body.
+    first = next(chunks)
+    return Response(stream_with_context(_chunks_from(first, chunks)), mimetype='application/zip',
+                    headers=headers)
+
+def _chunks_from(first, chunks):
+    yield first
+    yield from chunks
+
+def cached_response(cache_key, mimetype, download_name):
+    path = result_cache.get(cache_key)
+    if path is None:
+        return None
+    logging.info(f"Serving cached result {cache_key}")
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+VIDEO_ONLY_OPTIONS = ('detect_every', 'static_threshold', 'encoder', 'codec', 'crf', 'preset')
+
+def picture_cache_params(options):
+    # Pictures are never tracked or video-encoded, so these options do not
+    # change the output.
+    return {key: value for key, value in options.items() if key not in VIDEO_ONLY_OPTIONS}
+
+# Anonymization kernels. Each takes a region of interest and returns its
+# anonymized version. "gaussian" is the original 99x99 Gaussian blur; the
+# others are much cheaper on large regions.
+def _gaussian_kernel(roi):
+    return cv2.GaussianBlur(roi, (99, 99), 30)
+
+def _pixelate_kernel(roi, blocks=16):
+    (h, w) = roi.shape[:2]
+    small = cv2.resize(roi, (max(1, min(blocks, w)), max(1, min(blocks, h))), interpolation=cv2.INTER_AREA)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+
+def _downsample_blur_kernel(roi, factor=8):
+    (h, w) = roi.shape[:2]
+    small = cv2.resize(roi, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+    small = cv2.GaussianBlur(small, (0, 0), 3)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def _box_kernel(roi):
+    (h, w) = roi.shape[:2]
+    size = max(3, min(h, w) // 3)
+    return cv2.blur(roi, (size, size))
+
+def _fill_kernel(roi):
+    return np.zeros_like(roi)
+
+ANONYMIZE_KERNELS = {
+    'gaussian': _gaussian_kernel,
+    'pixelate': _pixelate_kernel,
+    'downsample': _downsample_blur_kernel,
+    'box': _box_kernel,
+    'fill': _fill_kernel,
+}
+
+def _clip_boxes(boxes, w, h):
+    clipped = []
+    for (startX, startY, endX, endY) in boxes:
+        startX, startY = max(0, int(startX)), max(0, int(startY))
+        endX, endY = min(w, int(endX)), min(h, int(endY))
+        if endX > startX and endY > startY:
+            clipped.append((startX, startY, endX, endY))
+    return clipped
+
+def _overlapping_groups(boxes):
+    groups = []
+    for box in boxes:
+        merged = [box]
+        for group in groups[:]:
+            if any(box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]
+                   for other in group):
+                merged.extend(group)
+                groups.remove(group)
+        groups.append(merged)
+    return groups
+
+def _blur_merged_boxes(frame, boxes, kernel):
+    # Overlapping boxes are merged into one mask and each merged region is
+    # anonymized once, then composited through the mask, so no pixel is
+    # blurred twice. All patches are computed before any is written back.
+    patches = []
+    for group in _overlapping_groups(boxes):
+        x0, y0 = min(b[0] for b in group), min(b[1] for b in group)
+        x1, y1 = max(b[2] for b in group), max(b[3] for b in group)
+        mask = np.zeros((y1 - y0, x1 - x0), bool)
+        for (startX, startY, endX, endY) in group:
+            mask[startY - y0:endY - y0, startX - x0:endX - x0] = True
+        patches.append((x0, y0, x1, y1, mask, kernel(frame[y0:y1, x0:x1])))
+    for x0, y0, x1, y1, mask, patch in patches:
+        np.copyto(frame[y0:y1, x0:x1], patch, where=mask[:, :, None])
+    return frame
+
+def blur_boxes(frame, boxes, options=None):
+    # Boxes are (startX, startY, endX, endY) in pixels.
+    options = options or {}
+    kernel = ANONYMIZE_KERNELS[options.get('kernel', ANONYMIZE_KERNEL)]
+    (h, w) = frame.shape[:2]
+    boxes = _clip_boxes(boxes, w, h)
+    if options.get('merge_boxes', MERGE_BOXES) and len(boxes) > 1:
+        return _blur_merged_boxes(frame, boxes, kernel)
+    for (startX, startY, endX, endY) in boxes:
+        frame[startY:endY, startX:endX] = kernel(frame[startY:endY, startX:endX])
+    return frame
+
+# Raised by the request parsers for bad client input; the routes answer it
+# with 400 instead of the generic 500.
+class InvalidRequest(ValueError):
+    pass
+
+def parse_worker_count(value, default=FRAME_WORKERS):
+    if value in (None, ''):
+        return default
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRequest(f"Invalid worker count: {value}")
+    return max(1, min(workers, os.cpu_count() or 1))
+
+def parse_batch_size(value):
+    if value in (None, ''):
+        return FACE_BATCH_SIZE
+    try:
+        batch_size = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRequest(f"Invalid batch size: {value}")
+    return max(1, batch_size)
+
+def parse_flag(value, default=False):
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def _parse_option(fields, name, default, cast, minimum, maximum=None):
+    value = fields.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise InvalidRequest(f"Invalid {name}: {value}")
+    value = max(minimum, value)
+    return value if maximum is None else min(maximum, value)
+
+def _parse_name(fields, name, default):
+    # Codec and preset names end up on the ffmpeg command line.
+    value = fields.get(name) or default
+    if not re.fullmatch(r'[A-Za-z0-9_.-]+', str(value)):
+        raise InvalidRequest(f"Invalid {name}: {value}")
+    return str(value)
+
+def _parse_choice(fields, name, default, choices):
+    # JSON bodies can carry lists or objects here; they are compared as text
+    # so they fail the lookup instead of raising TypeError.
+    value = str(fields.get(name) or default)
+    if value not in choices:
+        raise InvalidRequest(f"Invalid {name}: {value}. Choose one of {', '.join(choices)}")
+    return value
+
+def parse_stream_options(fields):
+    return {
+        'detect_every': _parse_option(fields, 'detect_every', DETECT_EVERY, int, 1),
+        'static_threshold': _parse_option(fields, 'static_threshold', STATIC_THRESHOLD, float, 0.0, 255.0),
+        'detection_scale': _parse_option(fields, 'detection_scale', PERSON_DETECTION_SCALE, float, 0.05, 1.0),
+        'kernel': _parse_choice(fields, 'kernel', ANONYMIZE_KERNEL, ANONYMIZE_KERNELS),
+        'merge_boxes': parse_flag(fields.get('merge_boxes'), MERGE_BOXES),
+        'eye_mode': _parse_choice(fields, 'eye_mode', EYE_MODE, EYE_MODES),
+        'tiled': parse_flag(fields.get('tiled'), TILED_DETECTION),
+        'encoder': _parse_choice(fields, 'encoder', VIDEO_ENCODER, VIDEO_ENCODERS),
+        'codec': _parse_name(fields, 'codec', VIDEO_CODEC),
+        'crf': _parse_option(fields, 'crf', VIDEO_CRF, int, 0, 63),
+        'preset': _parse_name(fields, 'preset', VIDEO_PRESET),
+    }
+
+# Per-request workspaces. create_workspace() makes a fresh directory under
+# WORKSPACE_ROOT; workspace() removes it again on exit, whether or not the
+# request succeeded.
+def create_workspace(prefix='request-'):
+    os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=WORKSPACE_ROOT)
+
+def remove_workspace(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+@contextlib.contextmanager
+def workspace(prefix='request-'):
+    path = create_workspace(prefix)
+    try:
+        yield path
+    finally:
+        remove_workspace(path)
+
+def workspace_file(work_dir, filename, default):
+    # Client-supplied names are reduced to their base name so they cannot
+    # escape the workspace.
+    return os.path.join(work_dir, os.path.basename(filename or '') or default)
+
+# Content-addressed result cache. A key is the SHA-256 of the operation, its
+# parameters and the content hashes of its inputs. Entries are plain files;
+# the in-memory index keeps them in least recently used order and is rebuilt
+# from the files' modification times on first use.
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_upload(upload):
+    digest = hashlib.sha256()
+    upload.stream.seek(0)
+    for chunk in iter(lambda: upload.stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    upload.stream.seek(0)
+    return digest.hexdigest()
+
+def result_cache_key(operation, params, *content_hashes):
+    payload = json.dumps([operation, params, content_hashes], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries = None
+        self.size = 0
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _load_index(self):
+        if self.entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if '.' in filename:
+                        continue
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    found.append((stat.st_mtime, filename, stat.st_size))
+        self.entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self.size = sum(self.entries.values())
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self.lock:
+            self._load_index()
+            path = self._path(key)
+            if key not in self.entries or not os.path.exists(path):
+                self.entries.pop(key, None)
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+        os.utime(path)
+        return path
+
+    def _commit(self, key, temp_path):
+        path = self._path(key)
+        size = os.path.getsize(temp_path)
+        with self.lock:
+            self._load_index()
+            os.replace(temp_path, path)
+            self.size += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self.counters["stores"] += 1
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                evicted, evicted_size = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.counters["evictions"] += 1
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+
+    def _temp_path(self, key):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        return f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+
+    def put_file(self, key, source_path):
+        if not self.enabled:
+            return
+        temp_path = self._temp_path(key)
+        try:
+            try:
+                os.link(source_path, temp_path)
+            except OSError:
+                shutil.copyfile(source_path, temp_path)
+            self._commit(key, temp_path)
+        except Exception as e:
+            logging.error(f"An error occurred while caching a result: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def put_bytes(self, key, data):
+        if not self.enabled:
+            return
+        temp_path = self._temp_path(key)
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            self._commit(key, temp_path)
+        except Exception as e:
+            logging.error(f"An error occurred while caching a result: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def tee(self, key, chunks):
+        # Passes a streamed response through while writing it to the cache;
+        # the entry is only stored if the stream runs to completion.
+        if not self.enabled:
+            yield from chunks
+            return
+        temp_path = self._temp_path(key)
+        completed = False
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+            try:
+                self._commit(key, temp_path)
+            except Exception as e:
+                logging.error(f"An error occurred while caching a result: {str(e)}")
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def stats(self):
+        with self.lock:
+            self._load_index()
+            return {**self.counters, "entries": len(self.entries), "bytes": self.size,
+                    "max_bytes": self.max_bytes}
+
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats()), 200
+
+# Metrics. Every request records the time it spends in each stage (download,
+# decode, detect, blur, encode, zip, ...), the items it handles and the bytes it
+# reads and writes into a RequestMetrics. When it finishes, these are folded
+# into process-wide histograms and counters served in the Prometheus text
+# format at /metrics, and the request's own summary is returned with its
+# result. Stage timings from worker threads and processes come back in the same
+# stats dicts as the detection counters: keys ending in "_seconds" are stage
+# durations, the others item counts.
+METRIC_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+METRIC_HELP = {
+    "blur_request_seconds": ("histogram", "Wall time of a request, by operation and outcome."),
+    "blur_stage_seconds": ("histogram", "Time a request spent in one stage; stages can overlap."),
+    "blur_requests_total": ("counter", "Finished requests, by operation and outcome."),
+    "blur_items_total": ("counter", "Items handled: frames, images, pages, detections, ..."),
+    "blur_bytes_total": ("counter", "Bytes read from inputs and written to outputs."),
+}
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+class MetricsRegistry:
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            entry = series.get(labels)
+            if entry is None:
+                entry = series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def increment(self, name, labels, value=1):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def render(self, extra=()):
+        # extra holds (name, type, help, [(labels, value), ...]) for values
+        # read at scrape time, such as gauges.
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {METRIC_HELP[name][1]}", f"# TYPE {name} histogram"]
+                for labels, entry in sorted(series.items()):
+                    for bound, count in zip(self.buckets, entry["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {entry['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {entry['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {entry['count']}")
+            counters = [(name, METRIC_HELP[name][0], METRIC_HELP[name][1], sorted(series.items()))
+                        for name, series in sorted(self.counters.items())]
+        for name, kind, help_text, samples in counters + list(extra):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(labels)} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry()
+
+class RequestMetrics:
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self.bytes = {"in": 0, "out": 0}
+        self.summary = None
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, kind, n=1):
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + n
+
+    def add_bytes(self, direction, n):
+        with self.lock:
+            self.bytes[direction] += n
+
+    def merge_stats(self, stats):
+        for key, value in stats.items():
+            if key.endswith('_seconds'):
+                self.add_time(key[:-len('_seconds')], value)
+            else:
+                self.count(key, value)
+
+    def finish(self, status='ok'):
+        # Records the request once; later calls return the same summary.
+        with self.lock:
+            if self.summary is not None:
+                return self.summary
+            elapsed = time.perf_counter() - self.started
+            self.summary = {
+                "operation": self.operation,
+                "status": status,
+                "seconds": round(elapsed, 3),
+                "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                "counts": dict(self.counts),
+                "bytes": dict(self.bytes),
+            }
+        labels = (("operation", self.operation),)
+        metrics_registry.observe("blur_request_seconds", labels + (("status", status),), elapsed)
+        metrics_registry.increment("blur_requests_total", labels + (("status", status),))
+        for stage, seconds in self.stages.items():
+            metrics_registry.observe("blur_stage_seconds", labels + (("stage", stage),), seconds)
+        for kind, n in self.counts.items():
+            metrics_registry.increment("blur_items_total", labels + (("kind", kind),), n)
+        for direction, n in self.bytes.items():
+            metrics_registry.increment("blur_bytes_total", labels + (("direction", direction),), n)
+        logging.info(f"{self.operation} {status} in {elapsed:.3f}s: "
+                     + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in self.stages.items()))
+        return self.summary
+
+def _finish_metrics_after(chunks, metrics):
+    # Finishes a streamed response's metrics once the last chunk is sent.
+    status = 'error'
+    try:
+        yield from chunks
+        status = 'ok'
+    except GeneratorExit:
+        status = 'aborted'
         raise
+    finally:
+        metrics.finish(status)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    cache = result_cache.stats()
+    with _jobs_lock:
+        job_counts = {}
+        for job in _jobs.values():
+            job_counts[job["status"]] = job_counts.get(job["status"], 0) + 1
+    extra = [
+        ("blur_result_cache_events_total", "counter", "Result cache lookups and updates, by event.",
+         [((("event", event),), cache[event]) for event in ("hits", "misses", "stores", "evictions")]),
+        ("blur_result_cache_bytes", "gauge", "Bytes held in the result cache.", [((), cache["bytes"])]),
+        ("blur_result_cache_entries", "gauge", "Entries held in the result cache.", [((), cache["entries"])]),
+        ("blur_jobs", "gauge", "Background jobs currently tracked, by status.",
+         [((("status", status),), count) for status, count in sorted(job_counts.items())]),
+    ]
+    return Response(metrics_registry.render(extra), mimetype='text/plain; version=0.0.4')
+
+# Request profiling. Each thread working on a profiled request runs under its
+# own cProfile profiler, and a sampler thread records the stacks of those
+# threads for a flame graph. When the request is done the profiles are merged
+# and written out as:
+#   profile.pstats  cProfile stats (pstats, snakeviz)
+#   profile.txt     the top functions by cumulative time
+#   profile.folded  collapsed stacks (flamegraph.pl, speedscope)
+#   profile.json    self time per library and the sample count
+# Nothing is installed unless a request asks for it. Work done in worker
+# processes shows up as time spent waiting on their results.
+PROFILE_LIBRARIES = (
+    ('opencv', ('cv2',)),
+    ('dlib', ('dlib', '_dlib_pybind11', 'face_recognition', 'face_recognition_models')),
+    ('pymupdf', ('fitz', 'pymupdf', 'mupdf')),
+    ('spacy', ('spacy', 'thinc')),
+    ('numpy', ('numpy',)),
+    ('waiting', ('_thread', 'threading', 'queue')),
+)
+
+def _c_function_libraries():
+    # cProfile names module-level C functions of some extensions by their bare
+    # name ("<GaussianBlur>"), so these are looked up in the loaded modules.
+    functions = {}
+    for library, names in reversed(PROFILE_LIBRARIES):
+        for module_name, module in list(sys.modules.items()):
+            if module is not None and module_name.split('.')[0] in names:
+                functions.update((attr, library) for attr in dir(module))
+    return functions
+
+def profile_library(filename, function_name, c_functions=None):
+    # Other C functions are named like "<built-in method cv2.imdecode>" or
+    # "<method 'read' of 'cv2.VideoCapture' objects>".
+    tokens = set(re.split(r"[^A-Za-z0-9_]+", f"{filename} {function_name}"))
+    for library, names in PROFILE_LIBRARIES:
+        if tokens.intersection(names):
+            return library
+    if c_functions and filename == '~' and function_name.strip('<>') in c_functions:
+        return c_functions[function_name.strip('<>')]
+    return 'python'
+
+class RequestProfiler:
+    def __init__(self, output_dir, interval=PROFILE_SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.profiles = []
+        self.threads = {}
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                threads = list(self.threads.items())
+            for ident, name in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join([name] + stack[::-1])] += 1
+
+    @contextlib.contextmanager
+    def thread(self):
+        # Profiles the calling thread for the duration of the block.
+        current = threading.current_thread()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Another profiler is already active on this thread.
+            logging.warning(f"cProfile unavailable in {current.name}, sampling only: {str(e)}")
+            profile = None
+        with self.lock:
+            self.threads[current.ident] = current.name
+            if self.sampler.ident is None:
+                self.sampler.start()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.threads.pop(current.ident, None)
+            if profile is not None:
+                profile.disable()
+                with self.lock:
+                    self.profiles.append(profile)
+
+    def wrap(self, target):
+        def run(*args, **kwargs):
+            with self.thread():
+                return target(*args, **kwargs)
+        return run
+
+    def stop(self):
+        self.stop_event.set()
+        if self.sampler.is_alive():
+            self.sampler.join()
+
+    def finish(self):
+        self.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = {"dir": self.output_dir, "samples": sum(self.samples.values()),
+                   "sample_interval": self.interval, "libraries": {}}
+        try:
+            with open(os.path.join(self.output_dir, 'profile.folded'), 'w') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            if self.profiles:
+                stats = pstats.Stats(*self.profiles)
+                stats.dump_stats(os.path.join(self.output_dir, 'profile.pstats'))
+                with open(os.path.join(self.output_dir, 'profile.txt'), 'w') as f:
+                    pstats.Stats(*self.profiles, stream=f).sort_stats('cumulative').print_stats(60)
+                libraries = {}
+                c_functions = _c_function_libraries()
+                for (filename, _, function_name), (_, _, self_time, _, _) in stats.stats.items():
+                    library = profile_library(filename, function_name, c_functions)
+                    libraries[library] = libraries.get(library, 0.0) + self_time
+                summary["libraries"] = {library: round(seconds, 4) for library, seconds
+                                        in sorted(libraries.items(), key=lambda item: -item[1])}
+            with open(os.path.join(self.output_dir, 'profile.json'), 'w') as f:
+                json.dump(summary, f, indent=2)
+        except Exception as e:
+            logging.error(f"An error occurred while writing the profile: {str(e)}")
+            raise
+        summary["files"] = sorted(os.listdir(self.output_dir))
+        logging.info(f"Profile written to {self.output_dir}")
+        return summary
+
+def start_profiler(fields, operation, output_dir=None):
+    # Returns None unless the request asked for profiling. Nothing runs until
+    # the first thread enters profiler.thread().
+    if not parse_flag(fields.get('profile')):
+        return None
+    if output_dir is None:
+        output_dir = os.path.join(PROFILE_DIR, f"{operation}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    return RequestProfiler(output_dir)
+
+def profiling(profiler):
+    return profiler.thread() if profiler is not None else contextlib.nullcontext()
+
+def _finish_profile_after(chunks, profiler):
+    try:
+        with profiler.thread():
+            yield from chunks
+    finally:
+        profiler.finish()
+
+# Model registry: every model is loaded lazily on first use and kept for the
+# lifetime of the process. Models that are not safe to share between threads
+# (cv2.dnn nets, Haar cascades) are kept in a pool of idle copies: a thread
+# checks a copy out on first use and keeps it until the thread ends, then the
+# copy goes back to the pool. Werkzeug starts a thread per request, so a plain
+# per-thread copy would reload the model on every request.
+_model_loaders = {}
+_models = {}
+_model_pools = {}
+_thread_models = threading.local()
+_models_lock = threading.Lock()
+_loaded_model_names = set()
+_warm_up_state = {"ready": False, "error": None, "started": False}
+_warm_up_lock = threading.Lock()
+
+def register_model(name, loader, per_thread=False, warm_up=None):
+    _model_loaders[name] = {"loader": loader, "per_thread": per_thread, "warm_up": warm_up}
+
+def _return_models(models):
+    with _models_lock:
+        for name, model in models.items():
+            _model_pools.setdefault(name, []).append(model)
+
+class _ModelLease:
+    # The per-thread models of one thread. It lives in a thread-local, so it
+    # is collected when its thread ends and its models return to the pools.
+    def __init__(self):
+        self.models = {}
+        weakref.finalize(self, _return_models, self.models)
+
+def _check_out_model(name, entry):
+    with _models_lock:
+        pool = _model_pools.get(name)
+        if pool:
+            return pool.pop()
+    started = time.perf_counter()
+    model = entry["loader"]()
+    _loaded_model_names.add(name)
+    logging.info(f"Loaded model '{name}' in {time.perf_counter() - started:.2f}s")
+    return model
+
+def get_model(name):
+    entry = _model_loaders.get(name)
+    if entry is None:
+        raise KeyError(f"Unknown model: {name}")
+
+    if entry["per_thread"]:
+        lease = getattr(_thread_models, 'lease', None)
+        if lease is None:
+            lease = _thread_models.lease = _ModelLease()
+        if name not in lease.models:
+            lease.models[name] = _check_out_model(name, entry)
+        return lease.models[name]
+
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                model = entry["loader"]()
+                _models[name] = model
+                _loaded_model_names.add(name)
+                logging.info(f"Loaded model '{name}' in {time.perf_counter() - started:.2f}s")
+    return model
+
+def warm_up_models(names=None):
+    try:
+        for name in names or list(_model_loaders):
+            started = time.perf_counter()
+            entry = _model_loaders[name]
+            # Per-thread models are warmed up in the pool, where the next
+            # request thread picks them up.
+            model = _check_out_model(name, entry) if entry["per_thread"] else get_model(name)
+            try:
+                if entry["warm_up"] is not None:
+                    entry["warm_up"](model)
+            finally:
+                if entry["per_thread"]:
+                    _return_models({name: model})
+            logging.info(f"Warmed up model '{name}' in {time.perf_counter() - started:.2f}s")
+        _warm_up_state["ready"] = True
+        _warm_up_state["error"] = None
+    except Exception as e:
+        logging.error(f"An error occurred while warming up models: {str(e)}")
+        _warm_up_state["error"] = str(e)
+    return _warm_up_state["ready"]
+
+def start_warm_up():
+    # Runs warm_up_models() once in a background thread. A failed warm-up is
+    # started again by the next call.
+    with _warm_up_lock:
+        if _warm_up_state["started"]:
+            return
+        _warm_up_state["started"] = True
+    threading.Thread(target=_warm_up_in_background, daemon=True).start()
+
+def _warm_up_in_background():
+    try:
+        warm_up_models()
+    finally:
+        with _warm_up_lock:
+            _warm_up_state["started"] = _warm_up_state["ready"]
+
+def models_ready():
+    # Models that requests have already loaded lazily count as well.
+    return _warm_up_state["ready"] or all(name in _loaded_model_names for name in _model_loaders)
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # The first probe starts the warm-up in the process that serves requests,
+    # so readiness needs no start-up flag under `flask run` either.
+    is_ready = models_ready()
+    if not is_ready:
+        start_warm_up()
+    status = {
+        "ready": is_ready,
+        "error": _warm_up_state["error"],
+        "models": {name: name in _loaded_model_names for name in _model_loaders},
+    }
+    return jsonify(status), 200 if is_ready else 503
 
 # Eye detection and blurring in pictures
 def load_eye_detector():
@@ -47,17 +1030,55 @@ def load_eye_detector():
         logging.error(f"Error loading eye detector model: {str(e)}")
         raise
 
-def detect_and_blur_eyes(eye_cascade, image_path, output_path):
+register_model('eye_detector', load_eye_detector, per_thread=True,
+               warm_up=lambda eye_cascade: eye_cascade.detectMultiScale(np.zeros((64, 64), np.uint8), 1.1, 4))
+
+def detect_eyes(eye_cascade, frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    eyes = eye_cascade.detectMultiScale(gray, 1.1, 4)
+    return [(x, y, x + w, y + h) for (x, y, w, h) in eyes]
+
+# Searching inside faces: the cascade only scans the upper part of each face
+# box, a small fraction of the frame, with its window sizes bounded by the
+# face size. A face where it finds no eye gets the eye band derived from the
+# face geometry, so a missed detection never leaves the eyes unblurred.
+EYE_MODES = ('frame', 'faces', 'geometry')
+
+def eye_search_region(face_box):
+    startX, startY, endX, endY = face_box
+    return startX, startY, endX, startY + int((endY - startY) * 0.6)
+
+def eye_band(face_box):
+    startX, startY, endX, endY = face_box
+    w, h = endX - startX, endY - startY
+    return startX + int(w * 0.12), startY + int(h * 0.2), endX - int(w * 0.12), startY + int(h * 0.55)
+
+def detect_eyes_in_faces(eye_cascade, frame, face_boxes, mode='faces'):
+    (h, w) = frame.shape[:2]
+    eyes = []
+    for face in _clip_boxes(face_boxes, w, h):
+        if mode == 'faces':
+            startX, startY, endX, endY = eye_search_region(face)
+            roi = frame[startY:endY, startX:endX]
+            if roi.size:
+                size = endX - startX
+                found = eye_cascade.detectMultiScale(cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY), 1.1, 4,
+                                                     minSize=(max(1, size // 10),) * 2,
+                                                     maxSize=(max(1, size // 2),) * 2)
+                if len(found):
+                    eyes.extend((startX + x, startY + y, startX + x + ew, startY + y + eh)
+                                for (x, y, ew, eh) in found)
+                    continue
+        eyes.append(eye_band(face))
+    return eyes
+
+def detect_and_blur_eyes_in_frame(eye_cascade, frame, options=None):
+    return blur_boxes(frame, detect_eyes(eye_cascade, frame), options)
+
+def detect_and_blur_eyes(eye_cascade, image_path, output_path, options=None):
     try:
         image = cv2.imread(image_path)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        eyes = eye_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        for (x, y, w, h) in eyes:
-            eye = image[y:y+h, x:x+w]
-            eye = cv2.GaussianBlur(eye, (99, 99), 30)
-            image[y:y+h, x:x+w] = eye
-
+        image = detect_and_blur_eyes_in_frame(eye_cascade, image, options)
         cv2.imwrite(output_path, image)
     except Exception as e:
         logging.error(f"An error occurred while detecting and blurring eyes: {str(e)}")
@@ -65,44 +1086,36 @@ def detect_and_blur_eyes(eye_cascade, image_path, output_path):
 
 @app.route('/blur-eyes-in-pictures', methods=['POST'])
 def blur_eyes_in_pictures():
+    metrics = None
     try:
         zip_file = request.files.get('zip_file')
         if not zip_file:
             return jsonify({"error": "No zip file provided"}), 400
 
-        downloads_dir = 'downloads'
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
-
-        zip_path = os.path.join(downloads_dir, 'input_images.zip')
-        extract_folder = os.path.join(downloads_dir, 'extracted_images')
-        output_folder = os.path.join(downloads_dir, 'blurred_images')
-        output_zip = os.path.join(downloads_dir, 'blurred_images.zip')
-
-        zip_file.save(zip_path)
-        extract_zip(zip_path, extract_folder)
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        eye_cascade = load_eye_detector()
-
-        for file_name in os.listdir(extract_folder):
-            if file_name.endswith(('jpg', 'jpeg', 'png')):
-                image_path = os.path.join(extract_folder, file_name)
-                name, ext = os.path.splitext(file_name)
-                output_path = os.path.join(output_folder, f"{name}_blur{ext}")
-                detect_and_blur_eyes(eye_cascade, image_path, output_path)
-
-        zip_files(output_folder, output_zip)
-
-        shutil.rmtree(extract_folder)
-        shutil.rmtree(output_folder)
-        os.remove(zip_path)
-
-        return send_file(output_zip, as_attachment=True, download_name='blurred_images.zip')
-
+        workers = parse_worker_count(request.form.get('workers'), IMAGE_WORKERS)
+        batch_size = parse_batch_size(request.form.get('batch_size'))
+        options = parse_stream_options(request.form)
+
+        metrics = RequestMetrics('eyes-pictures')
+        with metrics.stage('hash'):
+            cache_key = result_cache_key('eyes-pictures', picture_cache_params(options), hash_upload(zip_file))
+        profiler = start_profiler(request.form, 'eyes-pictures')
+        cached = None if profiler else cached_response(cache_key, 'application/zip', 'blurred_images.zip')
+        if cached:
+            metrics.finish('cached')
+            return cached
+
+        archive = open_zip_upload(zip_file, metrics)
+        entries = process_zip_images(archive, 'eyes', options=options, workers=workers, batch_size=batch_size,
+                                     metrics=metrics, profiler=profiler)
+        return zip_response(entries, cache_key=cache_key, metrics=metrics, profiler=profiler)
+
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
+        if metrics is not None:
+            metrics.finish('error')
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
 # Face detection and blurring in pictures
@@ -114,23 +1127,110 @@ def load_face_detector():
         logging.error(f"Error loading face detector model: {str(e)}")
         raise
 
-def detect_and_blur_faces(net, image_path, output_path):
+register_model('face_detector', load_face_detector, per_thread=True,
+               warm_up=lambda net: detect_faces_batch(net, [np.zeros((300, 300, 3), np.uint8)]))
+
+def detect_faces_scored(net, images):
+    # One blob and one forward pass for the whole batch; the SSD output rows
+    # carry the index of the image they belong to in column 0. Returns
+    # (box, confidence) pairs per image.
+    blob = cv2.dnn.blobFromImages([cv2.resize(image, (300, 300)) for image in images],
+                                  1.0, (300, 300), (104.0, 177.0, 123.0))
+    net.setInput(blob)
+    detections = net.forward()[0, 0]
+
+    found = [[] for _ in images]
+    for detection in detections[detections[:, 2] > 0.5]:
+        image_id = int(detection[0])
+        if 0 <= image_id < len(images):
+            (h, w) = images[image_id].shape[:2]
+            box = detection[3:7] * np.array([w, h, w, h])
+            found[image_id].append((box, float(detection[2])))
+    return found
+
+def detect_faces_batch(net, images):
+    return [[box.astype("int") for box, _ in found] for found in detect_faces_scored(net, images)]
+
+# Tiled detection. Tiles are taken at full resolution and at every halving of
+# the image until it fits in one tile, then the whole image is added as it is
+# seen without tiling. Faces split by a tile border are whole in the next tile
+# (the overlap) or at the next level, and the whole image catches the largest
+# ones. The tile count shrinks by four per level, so the cost stays linear in
+# the pixel count. Detections from all tiles are merged with non-maximum
+# suppression.
+def _tile_starts(length, tile_size, stride):
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+def detection_tiles(image, tile_size=DETECTION_TILE, overlap=TILE_OVERLAP):
+    # Returns (x, y, scale_x, scale_y, tile) with the tile's offset in the
+    # scaled image. Edge tiles are padded to the full tile size so the SSD
+    # never sees a stretched tile.
+    stride = max(1, int(tile_size * (1 - overlap)))
+    (h, w) = image.shape[:2]
+    tiles = []
+    level = image
+    while max(level.shape[:2]) > tile_size:
+        (level_h, level_w) = level.shape[:2]
+        scale_x, scale_y = level_w / w, level_h / h
+        for y in _tile_starts(level_h, tile_size, stride):
+            for x in _tile_starts(level_w, tile_size, stride):
+                tile = level[y:y + tile_size, x:x + tile_size]
+                if tile.shape[:2] != (tile_size, tile_size):
+                    tile = cv2.copyMakeBorder(tile, 0, tile_size - tile.shape[0], 0, tile_size - tile.shape[1],
+                                              cv2.BORDER_CONSTANT)
+                tiles.append((x, y, scale_x, scale_y, tile))
+        level = cv2.resize(level, (max(1, level_w // 2), max(1, level_h // 2)), interpolation=cv2.INTER_AREA)
+    tiles.append((0, 0, 1.0, 1.0, image))
+    return tiles
+
+def _cut_by_tile(box, x, y, tile_w, tile_h, level_w, level_h, margin=2):
+    # A face crossing an inner tile edge is only partly visible in that tile;
+    # the overlapping neighbour, a coarser level or the whole-image pass sees
+    # it complete, so the truncated box is dropped.
+    startX, startY, endX, endY = box
+    return ((x > 0 and startX <= margin) or (y > 0 and startY <= margin)
+            or (x + tile_w < level_w and endX >= tile_w - margin)
+            or (y + tile_h < level_h and endY >= tile_h - margin))
+
+def merge_detections(detections, threshold=NMS_THRESHOLD):
+    if not detections:
+        return []
+    rects = [[int(startX), int(startY), int(endX - startX), int(endY - startY)]
+             for (startX, startY, endX, endY), _ in detections]
+    scores = [score for _, score in detections]
+    keep = cv2.dnn.NMSBoxes(rects, scores, 0.0, threshold)
+    return [np.array(detections[i][0]).astype("int") for i in np.array(keep).flatten()]
+
+def detect_faces_tiled(net, images, tile_size=DETECTION_TILE, batch_size=TILE_BATCH_SIZE):
+    # The tiles of all images go through the SSD together, batch_size at a time.
+    tiles = [(image_id,) + tile for image_id, image in enumerate(images)
+             for tile in detection_tiles(image, tile_size)]
+    found = [[] for _ in images]
+    for start in range(0, len(tiles), batch_size):
+        chunk = tiles[start:start + batch_size]
+        for (image_id, x, y, scale_x, scale_y, tile), detections in zip(
+                chunk, detect_faces_scored(net, [entry[-1] for entry in chunk])):
+            (h, w) = images[image_id].shape[:2]
+            level_w, level_h = round(w * scale_x), round(h * scale_y)
+            for box, score in detections:
+                if _cut_by_tile(box, x, y, tile.shape[1], tile.shape[0], level_w, level_h):
+                    continue
+                startX, startY, endX, endY = box
+                found[image_id].append((((startX + x) / scale_x, (startY + y) / scale_y,
+                                         (endX + x) / scale_x, (endY + y) / scale_y), score))
+    return [merge_detections(detections) for detections in found]
+
+def detect_and_blur_faces_in_frame(net, frame, options=None):
+    return blur_boxes(frame, detect_faces_batch(net, [frame])[0], options)
+
+def detect_and_blur_faces(net, image_path, output_path, options=None):
     try:
         image = cv2.imread(image_path)
-        (h, w) = image.shape[:2]
-        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-        net.setInput(blob)
-        detections = net.forward()
-
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > 0.5:
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-                face = image[startY:endY, startX:endX]
-                face = cv2.GaussianBlur(face, (99, 99), 30)
-                image[startY:endY, startX:endX] = face
-
+        image = detect_and_blur_faces_in_frame(net, image, options)
         cv2.imwrite(output_path, image)
     except Exception as e:
         logging.error(f"An error occurred while detecting and blurring faces: {str(e)}")
@@ -138,259 +1238,2113 @@ def detect_and_blur_faces(net, image_path, output_path):
 
 @app.route('/blur-faces-in-pictures', methods=['POST'])
 def blur_faces_in_pictures():
+    metrics = None
     try:
         zip_file = request.files.get('zip_file')
         if not zip_file:
             return jsonify({"error": "No zip file provided"}), 400
 
-        downloads_dir = 'downloads'
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
-
-        zip_path = os.path.join(downloads_dir, 'input_images.zip')
-        extract_folder = os.path.join(downloads_dir, 'extracted_images')
-        output_folder = os.path.join(downloads_dir, 'blurred_images')
-        output_zip = os.path.join(downloads_dir, 'blurred_images.zip')
-
-        zip_file.save(zip_path)
-        extract_zip(zip_path, extract_folder)
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        net = load_face_detector()
-
-        for file_name in os.listdir(extract_folder):
-            if file_name.endswith(('jpg', 'jpeg', 'png')):
-                image_path = os.path.join(extract_folder, file_name)
-                name, ext = os.path.splitext(file_name)
-                output_path = os.path.join(output_folder, f"{name}_blur{ext}")
-                detect_and_blur_faces(net, image_path, output_path)
-
-        zip_files(output_folder, output_zip)
-
-        shutil.rmtree(extract_folder)
-        shutil.rmtree(output_folder)
-        os.remove(zip_path)
-
-        return send_file(output_zip, as_attachment=True, download_name='blurred_images.zip')
-
+        workers = parse_worker_count(request.form.get('workers'), IMAGE_WORKERS)
+        batch_size = parse_batch_size(request.form.get('batch_size'))
+        options = parse_stream_options(request.form)
+
+        metrics = RequestMetrics('faces-pictures')
+        with metrics.stage('hash'):
+            cache_key = result_cache_key('faces-pictures', picture_cache_params(options), hash_upload(zip_file))
+        profiler = start_profiler(request.form, 'faces-pictures')
+        cached = None if profiler else cached_response(cache_key, 'application/zip', 'blurred_images.zip')
+        if cached:
+            metrics.finish('cached')
+            return cached
+
+        archive = open_zip_upload(zip_file, metrics)
+        entries = process_zip_images(archive, 'faces', options=options, workers=workers, batch_size=batch_size,
+                                     metrics=metrics, profiler=profiler)
+        return zip_response(entries, cache_key=cache_key, metrics=metrics, profiler=profiler)
+
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
+        if metrics is not None:
+            metrics.finish('error')
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
 # Specific person detection and blurring in pictures
-def load_face_encodings(image_folder):
-    try:
-        encodings = []
-        for file_name in os.listdir(image_folder):
-            if file_name.endswith(('jpg', 'jpeg', 'png')):
-                image_path = os.path.join(image_folder, file_name)
-                image = face_recognition.load_image_file(image_path)
-                encoding = face_recognition.face_encodings(image)
-                if encoding:
-                    encodings.append(encoding[0])
-        return encodings
+def load_face_recognition():
+    # Importing face_recognition loads the dlib models, so it is deferred until
+    # the first request that needs it.
+    try:
+        return importlib.import_module('face_recognition')
+    except Exception as e:
+        logging.error(f"Error loading face recognition models: {str(e)}")
+        raise
+
+register_model('face_recognition', load_face_recognition,
+               warm_up=lambda fr: fr.face_locations(np.zeros((64, 64, 3), np.uint8)))
+
+# Reference encodings are cached on disk keyed by the SHA-256 of the image
+# bytes, so uploading the same reference photo again never re-encodes it. An
+# image without a face is cached as an empty (0, 128) array.
+def _encoding_cache_path(image_hash):
+    return os.path.join(PROFILES_DIR, 'encodings', f"{image_hash}.npy")
+
+def load_reference_encoding(data):
+    image_hash = hashlib.sha256(data).hexdigest()
+
+    cache_path = _encoding_cache_path(image_hash)
+    if os.path.exists(cache_path):
+        return image_hash, np.load(cache_path)
+
+    face_recognition = get_model('face_recognition')
+    image = face_recognition.load_image_file(io.BytesIO(data))
+    encodings = np.array(face_recognition.face_encodings(image)[:1], dtype=np.float64).reshape(-1, 128)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, encodings)
+    os.replace(tmp_path, cache_path)
+    return image_hash, encodings
+
+def load_reference_encodings(images):
+    # images is an iterable of (file name, image bytes).
+    image_hashes = []
+    encodings = []
+    for _, data in images:
+        image_hash, image_encodings = load_reference_encoding(data)
+        image_hashes.append(image_hash)
+        encodings.extend(image_encodings)
+    return image_hashes, encodings
+
+def load_zip_face_encodings(archive):
+    try:
+        return load_reference_encodings(iter_zip_entries(archive))
     except Exception as e:
         logging.error(f"An error occurred while loading face encodings: {str(e)}")
         raise
 
-def detect_and_blur_specific_person(image_path, output_path, known_encodings):
+# Reference person profiles: a named set of reference images registered once
+# and referred to by ID in later requests.
+PROFILE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+def _profile_path(profile_id):
+    if not PROFILE_ID_PATTERN.match(profile_id or ''):
+        raise InvalidRequest(f"Invalid profile ID: {profile_id}")
+    return os.path.join(PROFILES_DIR, f"{profile_id}.json")
+
+def load_profile(profile_id):
+    path = _profile_path(profile_id)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def load_profile_encodings(profile_id):
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise FileNotFoundError(f"Unknown profile: {profile_id}")
+    encodings = []
+    for image_hash in profile["image_hashes"]:
+        encodings.extend(np.load(_encoding_cache_path(image_hash)))
+    return encodings
+
+def parse_profile_ids(value):
+    return [profile_id.strip() for profile_id in (value or '').split(',') if profile_id.strip()]
+
+def missing_profiles(profile_ids):
+    return [profile_id for profile_id in profile_ids if load_profile(profile_id) is None]
+
+def save_profile(name, image_hashes, encoding_count, tolerance=None):
+    profile = {
+        "profile_id": uuid.uuid4().hex,
+        "name": name,
+        "image_hashes": image_hashes,
+        "encodings": encoding_count,
+        "tolerance": tolerance if tolerance is not None else MATCH_TOLERANCE,
+        "created": time.time(),
+    }
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    with open(_profile_path(profile["profile_id"]), 'w') as f:
+        json.dump(profile, f)
+    return profile
+
+def load_profiles_gallery(profile_ids):
+    identities = []
+    for profile_id in profile_ids:
+        profile = load_profile(profile_id)
+        if profile is None:
+            raise FileNotFoundError(f"Unknown profile: {profile_id}")
+        identities.append((profile_id, load_profile_encodings(profile_id), profile.get("tolerance")))
+    return FaceGallery.from_identities(identities)
+
+def get_known_gallery(profile_ids, zip_file):
+    if profile_ids:
+        return load_profiles_gallery(profile_ids)
+    return FaceGallery(load_zip_face_encodings(open_zip_upload(zip_file))[1])
+
+def gallery_content_hash(profile_ids, zip_file):
+    # Identifies the known faces for the result cache: the reference images
+    # and tolerance of each profile, or the reference zip itself.
+    if profile_ids:
+        profiles = [load_profile(profile_id) for profile_id in profile_ids]
+        return result_cache_key('profiles', [[p["image_hashes"], p.get("tolerance")] for p in profiles])
+    return hash_upload(zip_file)
+
+@app.route('/profiles', methods=['POST'])
+def create_profile():
     try:
-        image = face_recognition.load_image_file(image_path)
-        face_locations = face_recognition.face_locations(image)
-        face_encodings = face_recognition.face_encodings(image, face_locations)
+        name = request.form.get('name')
+        zip_file = request.files.get('zip_file')
+        tolerance = request.form.get('tolerance')
+        if not name or not zip_file:
+            return jsonify({"error": "Profile name and zip file are required"}), 400
+        if tolerance is not None:
+            try:
+                tolerance = float(tolerance)
+            except ValueError:
+                return jsonify({"error": f"Invalid tolerance: {tolerance}"}), 400
+
+        image_hashes, encodings = load_zip_face_encodings(open_zip_upload(zip_file))
 
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_encodings, face_encoding)
-            if True in matches:
-                face = image[top:bottom, left:right]
-                face = cv2.GaussianBlur(face, (99, 99), 30)
-                image[top:bottom, left:right] = face
+        if not encodings:
+            return jsonify({"error": "No faces found in the reference images"}), 400
 
-        cv2.imwrite(output_path, image[:, :, ::-1])
+        profile = save_profile(name, image_hashes, len(encodings), tolerance)
+        logging.info(f"Registered profile {profile['profile_id']} with {len(encodings)} encodings")
+        return jsonify(profile), 201
+
+    except Exception as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    try:
+        profile = load_profile(profile_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(profile), 200
+
+@app.route('/profiles/<profile_id>', methods=['DELETE'])
+def delete_profile(profile_id):
+    try:
+        path = _profile_path(profile_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not os.path.exists(path):
+        return jsonify({"error": "Profile not found"}), 404
+    os.remove(path)
+    return jsonify({"message": "Profile deleted", "profile_id": profile_id}), 200
+
+# Identity matching. All known encodings live in one (N, 128) matrix so the
+# faces found in a frame are matched against the whole gallery with a single
+# distance computation. Each row carries the tolerance of the identity it
+# belongs to. Large galleries can use an inverted-file index: encodings are
+# bucketed around k-means centroids and only the buckets nearest to a face
+# are searched.
+def build_ivf_index(encodings, n_lists=None, iterations=10, seed=0):
+    n_lists = min(len(encodings), n_lists or max(1, int(np.sqrt(len(encodings)))))
+    rng = np.random.default_rng(seed)
+    centroids = encodings[rng.choice(len(encodings), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmin(pairwise_distances(encodings, centroids), axis=1)
+        for i in range(n_lists):
+            members = encodings[assignment == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+    assignment = np.argmin(pairwise_distances(encodings, centroids), axis=1)
+    return {"centroids": centroids, "lists": [np.flatnonzero(assignment == i) for i in range(n_lists)]}
+
+def pairwise_distances(a, b, b_sq_norms=None):
+    if b_sq_norms is None:
+        b_sq_norms = (b ** 2).sum(axis=1)
+    sq = (a ** 2).sum(axis=1)[:, None] + b_sq_norms[None, :] - 2.0 * a @ b.T
+    return np.sqrt(np.maximum(sq, 0.0))
+
+class FaceGallery:
+    def __init__(self, encodings, labels=None, tolerances=None, use_index=None):
+        self.encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+        count = len(self.encodings)
+        self.labels = np.asarray(labels if labels is not None else [None] * count, dtype=object)
+        self.tolerances = np.asarray(tolerances if tolerances is not None else [MATCH_TOLERANCE] * count,
+                                     dtype=np.float64)
+        self.sq_norms = (self.encodings ** 2).sum(axis=1)
+        if use_index is None:
+            use_index = ANN_MIN_GALLERY > 0 and count >= ANN_MIN_GALLERY
+        self.index = build_ivf_index(self.encodings) if use_index and count else None
+
+    @classmethod
+    def from_identities(cls, identities, use_index=None):
+        encodings, labels, tolerances = [], [], []
+        for label, identity_encodings, tolerance in identities:
+            for encoding in identity_encodings:
+                encodings.append(encoding)
+                labels.append(label)
+                tolerances.append(MATCH_TOLERANCE if tolerance is None else tolerance)
+        return cls(encodings, labels, tolerances, use_index)
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def _candidates(self, face_encoding):
+        centroid_distances = pairwise_distances(face_encoding[None, :], self.index["centroids"])[0]
+        nearest = np.argsort(centroid_distances)[:ANN_PROBES]
+        return np.concatenate([self.index["lists"][i] for i in nearest])
+
+    def match(self, face_encodings):
+        # Returns, for each face, the label of the best matching identity, or
+        # False when no gallery encoding is within its identity's tolerance.
+        faces = np.asarray(face_encodings, dtype=np.float64).reshape(-1, 128)
+        results = [False] * len(faces)
+        if not len(faces) or not len(self):
+            return results
+
+        if self.index is None:
+            ratios = pairwise_distances(faces, self.encodings, self.sq_norms) / self.tolerances
+            best = np.argmin(ratios, axis=1)
+            for i, row in enumerate(best):
+                if ratios[i, row] <= 1.0:
+                    results[i] = self.labels[row] if self.labels[row] is not None else True
+            return results
+
+        for i, face in enumerate(faces):
+            candidates = self._candidates(face)
+            ratios = pairwise_distances(face[None, :], self.encodings[candidates],
+                                        self.sq_norms[candidates])[0] / self.tolerances[candidates]
+            if len(ratios) and ratios.min() <= 1.0:
+                row = candidates[np.argmin(ratios)]
+                results[i] = self.labels[row] if self.labels[row] is not None else True
+        return results
+
+def as_gallery(known):
+    return known if isinstance(known, FaceGallery) else FaceGallery(known)
+
+# Multi-resolution detection: the HOG detector runs on a copy downscaled by
+# `scale`, the boxes are mapped back to full resolution, and encodings are
+# computed from full-resolution crops around each face only.
+def locate_faces_downscaled(face_recognition, frame, scale):
+    (h, w) = frame.shape[:2]
+    small = cv2.resize(frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    small_locations = face_recognition.face_locations(np.ascontiguousarray(small[:, :, ::-1]))
+    return [(max(0, int(top / scale)), min(w, int(right / scale)),
+             min(h, int(bottom / scale)), max(0, int(left / scale)))
+            for (top, right, bottom, left) in small_locations]
+
+def encode_face_crops(face_recognition, frame, face_locations, margin=0.25):
+    (h, w) = frame.shape[:2]
+    encodings = []
+    for (top, right, bottom, left) in face_locations:
+        pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+        y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+        x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+        crop = np.ascontiguousarray(frame[y0:y1, x0:x1, ::-1])
+        location = (top - y0, right - x0, bottom - y0, left - x0)
+        encodings.extend(face_recognition.face_encodings(crop, [location]))
+    return encodings
+
+def detect_specific_person(frame, gallery, scale=1.0):
+    face_recognition = get_model('face_recognition')
+    if scale < 1.0:
+        face_locations = locate_faces_downscaled(face_recognition, frame, scale)
+        if not face_locations:
+            return []
+        face_encodings = encode_face_crops(face_recognition, frame, face_locations)
+    else:
+        rgb_frame = np.ascontiguousarray(frame[:, :, ::-1])
+        face_locations = face_recognition.face_locations(rgb_frame)
+        if not face_locations:
+            return []
+        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+
+    boxes = []
+    for (top, right, bottom, left), match in zip(face_locations, as_gallery(gallery).match(face_encodings)):
+        if match is not False:
+            boxes.append((left, top, right, bottom))
+    return boxes
+
+def detect_and_blur_specific_person_in_frame(frame, gallery, options=None):
+    options = options or {}
+    boxes = detect_specific_person(frame, gallery, options.get('detection_scale', 1.0))
+    return blur_boxes(frame, boxes, options)
+
+def detect_and_blur_specific_person(image_path, output_path, gallery, options=None):
+    try:
+        image = cv2.imread(image_path)
+        image = detect_and_blur_specific_person_in_frame(image, gallery, options)
+        cv2.imwrite(output_path, image)
     except Exception as e:
         logging.error(f"An error occurred while detecting and blurring the specific person: {str(e)}")
         raise
 
 @app.route('/blur-specific-person-in-pictures', methods=['POST'])
 def blur_specific_person_in_pictures():
+    metrics = None
     try:
         reference_zip_file = request.files.get('reference_zip_file')
+        profile_ids = parse_profile_ids(request.form.get('profile_id'))
         target_zip_file = request.files.get('target_zip_file')
 
-        if not reference_zip_file or not target_zip_file:
-            return jsonify({"error": "Both reference and target zip files are required"}), 400
-
-        downloads_dir = 'downloads'
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
-
-        reference_zip_path = os.path.join(downloads_dir, 'reference_images.zip')
-        target_zip_path = os.path.join(downloads_dir, 'target_images.zip')
-        reference_folder = os.path.join(downloads_dir, 'reference_images')
-        target_folder = os.path.join(downloads_dir, 'target_images')
-        output_folder = os.path.join(downloads_dir, 'blurred_images')
-        output_zip = os.path.join(downloads_dir, 'blurred_images.zip')
-
-        reference_zip_file.save(reference_zip_path)
-        target_zip_file.save(target_zip_path)
-        extract_zip(reference_zip_path, reference_folder)
-        extract_zip(target_zip_path, target_folder)
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        known_encodings = load_face_encodings(reference_folder)
-
-        for file_name in os.listdir(target_folder):
-            if file_name.endswith(('jpg', 'jpeg', 'png')):
-                image_path = os.path.join(target_folder, file_name)
-                name, ext = os.path.splitext(file_name)
-                output_path = os.path.join(output_folder, f"{name}_blur{ext}")
-                detect_and_blur_specific_person(image_path, output_path, known_encodings)
-
-        zip_files(output_folder, output_zip)
-
-        shutil.rmtree(reference_folder)
-        shutil.rmtree(target_folder)
-        shutil.rmtree(output_folder)
-        os.remove(reference_zip_path)
-        os.remove(target_zip_path)
-
-        return send_file(output_zip, as_attachment=True, download_name='blurred_images.zip')
-
+        if not (reference_zip_file or profile_ids) or not target_zip_file:
+            return jsonify({"error": "A reference zip file or profile ID and a target zip file are required"}), 400
+        missing = missing_profiles(profile_ids)
+        if missing:
+            return jsonify({"error": f"Profile not found: {', '.join(missing)}"}), 404
+
+        workers = parse_worker_count(request.form.get('workers'), IMAGE_WORKERS)
+        options = parse_stream_options(request.form)
+
+        metrics = RequestMetrics('person-pictures')
+        with metrics.stage('hash'):
+            cache_key = result_cache_key('person-pictures', picture_cache_params(options),
+                                         gallery_content_hash(profile_ids, reference_zip_file),
+                                         hash_upload(target_zip_file))
+        profiler = start_profiler(request.form, 'person-pictures')
+        cached = None if profiler else cached_response(cache_key, 'application/zip', 'blurred_images.zip')
+        if cached:
+            metrics.finish('cached')
+            return cached
+
+        with metrics.stage('gallery'):
+            gallery = get_known_gallery(profile_ids, reference_zip_file)
+        archive = open_zip_upload(target_zip_file, metrics)
+        entries = process_zip_images(archive, 'person', gallery, options, workers=workers, metrics=metrics,
+                                     profiler=profiler)
+        return zip_response(entries, cache_key=cache_key, metrics=metrics, profiler=profiler)
+
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
+        if metrics is not None:
+            metrics.finish('error')
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
 # PDF text redaction
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    doc = fitz.open(pdf_path)
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        text += page.get_text()
-    return text
-
-def redact_text_in_pdf(pdf_path, output_path, redaction_list):
-    try:
-        doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
+# Named entity recognition runs page by page through nlp.pipe, NER_BATCH_SIZE
+# texts at a time and optionally in NER_PROCESSES processes. Pages longer than
+# NER_CHUNK_CHARS are split at line breaks. Only the components NER needs are
+# kept: en_core_web_sm's ner has its own token-to-vector layer.
+NER_BATCH_SIZE = int(os.environ.get('BLUR_NER_BATCH_SIZE', '16'))
+NER_PROCESSES = int(os.environ.get('BLUR_NER_PROCESSES', '1'))
+NER_CHUNK_CHARS = 100000
+NLP_DISABLED_COMPONENTS = ["parser", "lemmatizer", "tagger", "attribute_ruler"]
+
+def load_nlp():
+    try:
+        return spacy.load("en_core_web_sm", disable=NLP_DISABLED_COMPONENTS)
+    except Exception as e:
+        logging.error(f"Error loading spaCy model: {str(e)}")
+        raise
+
+register_model('nlp', load_nlp, warm_up=lambda nlp: nlp("Warm up the named entity recognizer."))
+
+# Redaction works on a word index: every page's words and their boxes are
+# extracted once, the text handed to the NER model is rebuilt from them, and
+# all redaction targets are matched against the index in a single pass with a
+# token trie, so multi-word entities match across line breaks. Each page that
+# has matches gets all its annotations before one apply_redactions call.
+def open_pdf(pdf):
+    return pdf if isinstance(pdf, fitz.Document) else fitz.open(pdf)
+
+def extract_pdf_words(doc):
+    return [page.get_text("words") for page in doc]
+
+def page_text_from_words(words):
+    lines = []
+    current = None
+    for word in words:
+        if (word[5], word[6]) != current:
+            current = (word[5], word[6])
+            lines.append([])
+        lines[-1].append(word[4])
+    return "\n".join(" ".join(line) for line in lines)
+
+# Targets and PDF words are split into tokens on every character that is not a
+# letter or a digit, the way the NER tokenizer splits "John/Mary",
+# "Acme-based" or "Dr.Smith", so a target also matches inside such a word.
+WORD_TOKEN = re.compile(r"[^\W_]+")
+
+def word_tokens(text):
+    # Returns (token, start, end) for each token of text, casefolded.
+    return [(match.group().casefold(), match.start(), match.end()) for match in WORD_TOKEN.finditer(text)]
+
+def index_word_tokens(words):
+    # Returns (token, word index, start, end) for every token on the page.
+    return [(token, index, start, end) for index, word in enumerate(words)
+            for token, start, end in word_tokens(word[4])]
+
+def build_redaction_trie(redaction_list):
+    trie = {}
+    for redaction in redaction_list:
+        tokens = [token for token, _, _ in word_tokens(redaction)]
+        if not tokens:
+            continue
+        node = trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[None] = True
+    return trie
+
+def match_redactions(tokens, trie):
+    # Returns the indices of all tokens that are part of a redaction target.
+    matched = set()
+    for start in range(len(tokens)):
+        node = trie
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end][0])
+            if node is None:
+                break
+            if None in node:
+                matched.update(range(start, end + 1))
+    return matched
+
+def _token_rects(page, word, spans):
+    # Locates matched tokens inside a longer word ("Mary" in "John/Mary") with
+    # search_for, clipped to the word box. Falls back to the whole word box.
+    text = word[4].casefold()
+    word_rect = fitz.Rect(word[:4])
+    rects = []
+    for start, end in spans:
+        token = word[4][start:end]
+        hits = page.search_for(token, clip=word_rect)
+        occurrence = text[:start].count(token.casefold())
+        rects.append(hits[occurrence] if occurrence < len(hits) else word_rect)
+    return rects
+
+def redaction_rects(page, words, tokens, matched):
+    # A word whose tokens all matched is covered by its word box. Runs of such
+    # words on one line become a single rectangle: adding an annotation gets
+    # slower with every annotation on the page.
+    spans = {}
+    for index in matched:
+        _, word_index, start, end = tokens[index]
+        spans.setdefault(word_index, []).append((start, end))
+    token_counts = Counter(word_index for _, word_index, _, _ in tokens)
+    rects = []
+    previous = None
+    for word_index in sorted(spans):
+        word = words[word_index]
+        if len(spans[word_index]) < token_counts[word_index]:
+            rects.extend(_token_rects(page, word, sorted(spans[word_index])))
+            previous = None
+            continue
+        if previous == word_index - 1 and words[previous][5:7] == word[5:7]:
+            rects[-1] |= fitz.Rect(word[:4])
+        else:
+            rects.append(fitz.Rect(word[:4]))
+        previous = word_index
+    return rects
+
+def redact_text_in_pdf(pdf, output_path, redaction_list, page_words=None):
+    # redaction_list is either a list of targets searched on every page, or a
+    # dict mapping each target to the indices of the pages it was found on.
+    # Returns the number of redacted areas.
+    redactions = 0
+    try:
+        doc = open_pdf(pdf)
+        if page_words is None:
+            page_words = extract_pdf_words(doc)
+        if isinstance(redaction_list, dict):
+            page_targets = {}
+            for target, pages in redaction_list.items():
+                for page_num in pages:
+                    page_targets.setdefault(page_num, []).append(target)
+            page_tries = {page_num: build_redaction_trie(targets) for page_num, targets in page_targets.items()}
+        else:
+            trie = build_redaction_trie(redaction_list)
+            page_tries = {page_num: trie for page_num in range(len(page_words))}
+        for page_num, words in enumerate(page_words):
+            if page_num not in page_tries:
+                continue
             page = doc[page_num]
-            for redaction in redaction_list:
-                text_instances = page.search_for(redaction)
-                for inst in text_instances:
-                    page.add_redact_annot(inst, text=" ", fill=(0, 0, 0))
+            tokens = index_word_tokens(words)
+            matched = match_redactions(tokens, page_tries[page_num])
+            if not matched:
+                continue
+            for rect in redaction_rects(page, words, tokens, matched):
+                page.add_redact_annot(rect, text=" ", fill=(0, 0, 0))
+                redactions += 1
             page.apply_redactions()
         doc.save(output_path)
     except Exception as e:
         raise RuntimeError(f"An error occurred while redacting the PDF: {str(e)}")
-
-def identify_redaction_targets(text, instruction):
-    doc = nlp(text)
-    redaction_targets = []
-
-    if "project" in instruction.lower():
-        for ent in doc.ents:
-            if ent.label_ in ["ORG", "WORK_OF_ART", "PRODUCT", "EVENT"]:
-                redaction_targets.append(ent.text)
-
-    if "person" in instruction.lower():
+    return redactions
+
+def iter_ner_chunks(page_texts, max_chars=NER_CHUNK_CHARS):
+    for page_num, text in enumerate(page_texts):
+        chunk = []
+        size = 0
+        lines = text.split("\n")
+        pieces = (line[i:i + max_chars] for line in lines for i in range(0, max(len(line), 1), max_chars))
+        for piece in pieces:
+            if chunk and size + len(piece) + 1 > max_chars:
+                yield "\n".join(chunk), page_num
+                chunk = []
+                size = 0
+            chunk.append(piece)
+            size += len(piece) + 1
+        if chunk:
+            yield "\n".join(chunk), page_num
+
+def identify_redaction_targets(page_texts, instruction, batch_size=None, n_process=None):
+    # Returns a dict mapping each target to the set of page indices it was
+    # found on. A single string is treated as one page.
+    if isinstance(page_texts, str):
+        page_texts = [page_texts]
+    instruction = instruction.lower()
+    labels = set()
+    if "project" in instruction:
+        labels.update(["ORG", "WORK_OF_ART", "PRODUCT", "EVENT"])
+    if "person" in instruction:
+        labels.add("PERSON")
+    redact_all = "everything" in instruction
+
+    redaction_targets = {}
+    if not (labels or redact_all):
+        return redaction_targets
+    docs = get_model('nlp').pipe(iter_ner_chunks(page_texts), as_tuples=True,
+                                 batch_size=batch_size or NER_BATCH_SIZE, n_process=n_process or NER_PROCESSES)
+    for doc, page_num in docs:
         for ent in doc.ents:
-            if ent.label_ in ["PERSON"]:
-                redaction_targets.append(ent.text)
-
-    if "everything" in instruction.lower():
-        redaction_targets.extend([ent.text for ent in doc.ents])
-
-    return list(set(redaction_targets))
+            if redact_all or ent.label_ in labels:
+                redaction_targets.setdefault(ent.text, set()).add(page_num)
+    return redaction_targets
+
+def redact_pdf_document(doc, output_path, instruction):
+    # Returns the stage timings and counts for the request metrics.
+    started = time.perf_counter()
+    page_words = extract_pdf_words(doc)
+    page_texts = [page_text_from_words(words) for words in page_words]
+    stats = {"pages": len(page_words), "extract_seconds": time.perf_counter() - started}
+    started = time.perf_counter()
+    redaction_list = identify_redaction_targets(page_texts, instruction)
+    stats["ner_seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+    stats["redactions"] = redact_text_in_pdf(doc, output_path, redaction_list, page_words)
+    stats["redact_seconds"] = time.perf_counter() - started
+    return stats
+
+# Large documents can be split into page ranges that are redacted in separate
+# processes and merged back in order. Entities are recognized and matched per
+# page, so each page is redacted exactly as it would be in one pass.
+def pdf_page_ranges(page_count, workers, min_range_pages=PDF_MIN_RANGE_PAGES):
+    # A few ranges per worker so uneven pages still balance across processes.
+    range_count = max(1, min(workers * 4, page_count // min_range_pages))
+    bounds = [page_count * i // range_count for i in range(range_count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _redact_pdf_range(pdf_path, output_path, instruction, start, end):
+    with fitz.open(pdf_path) as doc:
+        doc.select(list(range(start, end)))
+        return redact_pdf_document(doc, output_path, instruction)
+
+def redact_pdf_in_ranges(pdf_path, output_path, instruction, workers):
+    with fitz.open(pdf_path) as doc:
+        ranges = pdf_page_ranges(len(doc), workers)
+        metadata = doc.metadata
+        toc = doc.get_toc(simple=False)
+    part_paths = [f"{output_path}.{i}.part" for i in range(len(ranges))]
+    logging.info(f"Redacting {len(ranges)} page ranges in {workers} processes")
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                                   mp_context=multiprocessing.get_context('spawn'))
+    try:
+        futures = [executor.submit(_redact_pdf_range, pdf_path, part_path, instruction, start, end)
+                   for part_path, (start, end) in zip(part_paths, ranges)]
+        stats = {}
+        for future in futures:
+            _merge_stats(stats, future.result())
+        started = time.perf_counter()
+        with fitz.open() as merged:
+            for part_path in part_paths:
+                with fitz.open(part_path) as part:
+                    merged.insert_pdf(part)
+            merged.set_metadata(metadata)
+            try:
+                merged.set_toc(toc)
+            except Exception as e:
+                logging.warning(f"Could not restore the table of contents: {str(e)}")
+            merged.save(output_path)
+        stats["merge_seconds"] = time.perf_counter() - started
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return stats
+
+def redact_pdf_file(pdf_path, output_path, instruction, workers=1):
+    with fitz.open(pdf_path) as doc:
+        if workers <= 1 or len(doc) < PDF_PARALLEL_MIN_PAGES:
+            return redact_pdf_document(doc, output_path, instruction)
+    return redact_pdf_in_ranges(pdf_path, output_path, instruction, workers)
 
 @app.route('/redact-pdf', methods=['POST'])
 def redact_pdf():
+    metrics = None
     try:
         pdf_file = request.files.get('pdf_file')
         instruction = request.form.get('instruction')
 
         if not pdf_file or not instruction:
             return jsonify({"error": "PDF file and instruction are required"}), 400
-
-        uploads_dir = 'uploads'
-        downloads_dir = 'downloads'
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
-
-        pdf_path = os.path.join(uploads_dir, pdf_file.filename)
-        redacted_pdf_path = os.path.join(downloads_dir, f"redacted_{pdf_file.filename}")
-
-        pdf_file.save(pdf_path)
-
-        text = extract_text_from_pdf(pdf_path)
-
-        redaction_list = identify_redaction_targets(text, instruction)
-
-        redact_text_in_pdf(pdf_path, redacted_pdf_path, redaction_list)
-
-        os.remove(pdf_path)
-
-        return send_file(redacted_pdf_path, as_attachment=True, download_name=f"redacted_{pdf_file.filename}")
-
+        workers = parse_worker_count(request.form.get('workers'), PDF_WORKERS)
+
+        metrics = RequestMetrics('redact')
+        download_name = f"redacted_{os.path.basename(pdf_file.filename or '') or 'document.pdf'}"
+        with metrics.stage('hash'):
+            cache_key = result_cache_key('redact', {"instruction": instruction}, hash_upload(pdf_file))
+        profiler = start_profiler(request.form, 'redact')
+        cached = None if profiler else cached_response(cache_key, 'application/pdf', download_name)
+        if cached:
+            metrics.finish('cached')
+            return cached
+
+        with workspace() as work_dir:
+            pdf_path = workspace_file(work_dir, pdf_file.filename, 'document.pdf')
+            redacted_pdf_path = os.path.join(work_dir, download_name)
+
+            pdf_file.save(pdf_path)
+            metrics.add_bytes('in', os.path.getsize(pdf_path))
+            try:
+                with profiling(profiler):
+                    metrics.merge_stats(redact_pdf_file(pdf_path, redacted_pdf_path, instruction, workers))
+            finally:
+                if profiler is not None:
+                    profiler.finish()
+
+            with open(redacted_pdf_path, 'rb') as f:
+                redacted_pdf = f.read()
+            metrics.add_bytes('out', len(redacted_pdf))
+            result_cache.put_bytes(cache_key, redacted_pdf)
+
+        response = send_file(io.BytesIO(redacted_pdf), mimetype='application/pdf', as_attachment=True,
+                             download_name=download_name)
+        response.headers['X-Request-Metrics'] = json.dumps(metrics.finish())
+        if profiler is not None:
+            response.headers['X-Profile-Dir'] = profiler.output_dir
+        return response
+
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
+        if metrics is not None:
+            metrics.finish('error')
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
 # Video processing
-def download_youtube_video(url, filename):
+# Remote video ingestion. Videos are downloaded in chunks over a reused
+# requests session, and an interrupted transfer resumes from the bytes already
+# on disk with an HTTP Range request. The download runs in the background while
+# frames are decoded from the growing file: a fast-start MP4 (moov atom before
+# the media data) can be decoded as soon as its moov atom is on disk, anything
+# else once the download is complete. A stopped or cancelled download ends
+# after its current chunk, so chunks are kept small.
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('BLUR_DOWNLOAD_CHUNK_SIZE', str(64 * 1024)))
+DOWNLOAD_RETRIES = int(os.environ.get('BLUR_DOWNLOAD_RETRIES', '5'))
+DOWNLOAD_TIMEOUT = 30
+# The decoder stays this many bytes behind the end of the next frame in the
+# media data, so it never reads a sample that is only partially downloaded.
+# Frame positions come from the MP4 sample table; the decoder may read
+# DECODE_LOOKAHEAD samples ahead of the frame it returns (B-frames).
+DOWNLOAD_READ_MARGIN = 4 * 1024 * 1024
+DECODE_LOOKAHEAD = 16
+
+# One session for all downloads, so connections to the same host are reused
+# across requests. Every download runs on its own thread; the adapter's pool
+# holds a connection per concurrent download.
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
+class DownloadProgress:
+    # Shared between the download thread and the frame decoder.
+    def __init__(self, path):
+        self.path = path
+        self.bytes_done = 0
+        self.total = None
+        self.finished = False
+        self.error = None
+        self.layout = None
+        self.sample_ends = None
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.stop_event = threading.Event()
+        self.condition = threading.Condition()
+
+    def update(self, bytes_done, total):
+        with self.condition:
+            self.bytes_done = bytes_done
+            self.total = total
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.finished = True
+            self.error = error
+            self.seconds = time.perf_counter() - self.started
+            self.condition.notify_all()
+
+    def wait_until(self, ready, stop_event=None, cancel_event=None):
+        # Blocks until ready() holds or the download is over. Returns True if
+        # ready() holds, False if the download finished first.
+        with self.condition:
+            while not ready():
+                if self.error is not None:
+                    raise self.error
+                if self.finished:
+                    return False
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                if stop_event is not None and stop_event.is_set():
+                    raise PipelineAborted()
+                self.condition.wait(timeout=0.1)
+            return True
+
+    def wait_finished(self, stop_event=None, cancel_event=None):
+        self.wait_until(lambda: False, stop_event, cancel_event)
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            while not self.finished:
+                self.condition.wait(timeout=0.1)
+
+def _content_range_total(response):
+    content_range = response.headers.get('Content-Range', '')
+    total = content_range.rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+def download_file(url, filename, progress=None, stop_event=None, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                  retries=DOWNLOAD_RETRIES):
+    session = get_http_session()
+    failures = 0
+    while True:
+        offset = os.path.getsize(filename) if os.path.exists(filename) else 0
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 416 and _content_range_total(response) == offset:
+                    return offset
+                if response.status_code == 206:
+                    mode = 'ab'
+                    total = _content_range_total(response)
+                elif response.status_code == 200:
+                    mode = 'wb'
+                    offset = 0
+                    length = response.headers.get('Content-Length')
+                    total = int(length) if length and length.isdigit() else None
+                else:
+                    raise Exception(f"Failed to download {url}: HTTP {response.status_code}")
+
+                with open(filename, mode) as f:
+                    for chunk in response.iter_content(chunk_size):
+                        if stop_event is not None and stop_event.is_set():
+                            raise PipelineAborted()
+                        f.write(chunk)
+                        f.flush()
+                        offset += len(chunk)
+                        failures = 0
+                        if progress is not None:
+                            progress.update(offset, total)
+                if total is not None and offset < total:
+                    raise requests.ConnectionError(f"Connection closed after {offset} of {total} bytes")
+                return offset
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            failures += 1
+            if failures > retries:
+                raise
+            logging.warning(f"Download interrupted at {offset} bytes, resuming ({failures}/{retries}): {str(e)}")
+            time.sleep(min(0.5 * 2 ** (failures - 1), 10))
+
+def start_download(url, filename, description):
+    progress = DownloadProgress(filename)
+
+    def run():
+        try:
+            logging.info(f"Downloading {description} from URL: {url}")
+            download_file(url, filename, progress, progress.stop_event)
+            logging.info("Video downloaded successfully")
+            progress.finish()
+        except PipelineAborted:
+            progress.finish(PipelineAborted())
+        except Exception as e:
+            logging.error(f"An error occurred while downloading the video: {str(e)}")
+            progress.finish(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return progress
+
+def youtube_stream_url(url):
     try:
         yt = YouTube(url)
-        stream = yt.streams.filter(file_extension='mp4').first()
+        stream = yt.streams.filter(file_extension='mp4', progressive=True).first()
         if not stream:
             raise Exception("No valid video stream found.")
-        stream.download(filename=filename)
+        return stream.url
     except HTTPError as e:
         logging.error(f"HTTP Error: {e.code} - {e.reason}")
         raise
     except Exception as e:
-        logging.error(f"An error occurred while downloading the video: {str(e)}")
+        logging.error(f"An error occurred while resolving the YouTube video: {str(e)}")
         raise
 
+def download_youtube_video(url, filename):
+    return start_download(youtube_stream_url(url), filename, "YouTube video")
+
 def download_vimeo_video(url, filename):
+    return start_download(url, filename, "Vimeo video")
+
+def mp4_media_layout(path):
+    # Walks the top-level MP4 boxes on disk. Returns (start, end) of the media
+    # data once a complete moov box precedes it, False if the file is not
+    # fast-start, or None while not enough of the file is there to tell.
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size < 8:
+        return None
+    moov_done = False
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset + 8 <= size:
+            f.seek(offset)
+            header = f.read(16)
+            box_size = int.from_bytes(header[:4], 'big')
+            box_type = header[4:8]
+            header_size = 8
+            if box_size == 1:
+                if len(header) < 16:
+                    return None
+                box_size = int.from_bytes(header[8:16], 'big')
+                header_size = 16
+            elif box_size == 0:
+                box_size = None
+            if box_type == b'mdat':
+                if not moov_done:
+                    return False
+                return offset + header_size, offset + box_size if box_size else None
+            if box_size is None or box_size < header_size:
+                return False
+            if box_type == b'moov':
+                if offset + box_size > size:
+                    return None
+                moov_done = True
+            offset += box_size
+    return None
+
+def _mp4_boxes(data, offset, end):
+    # Yields (type, payload start, end) of the boxes in data[offset:end].
+    while offset + 8 <= end:
+        box_size = int.from_bytes(data[offset:offset + 4], 'big')
+        box_type = data[offset + 4:offset + 8]
+        header_size = 8
+        if box_size == 1:
+            box_size = int.from_bytes(data[offset + 8:offset + 16], 'big')
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header_size:
+            return
+        yield box_type, offset + header_size, min(offset + box_size, end)
+        offset += box_size
+
+def _mp4_child(data, start, end, box_type):
+    for child_type, child_start, child_end in _mp4_boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+def _mp4_sample_ends(data, stbl):
+    stsz = _mp4_child(data, *stbl, b'stsz')
+    stsc = _mp4_child(data, *stbl, b'stsc')
+    stco, width = _mp4_child(data, *stbl, b'stco'), 4
+    if stco is None:
+        stco, width = _mp4_child(data, *stbl, b'co64'), 8
+    if stsz is None or stsc is None or stco is None:
+        return None
+    sample_size = int.from_bytes(data[stsz[0] + 4:stsz[0] + 8], 'big')
+    count = int.from_bytes(data[stsz[0] + 8:stsz[0] + 12], 'big')
+    if sample_size:
+        sizes = np.full(count, sample_size, np.int64)
+    else:
+        sizes = np.frombuffer(data, '>u4', count, stsz[0] + 12).astype(np.int64)
+    chunk_count = int.from_bytes(data[stco[0] + 4:stco[0] + 8], 'big')
+    offsets = np.frombuffer(data, f'>u{width}', chunk_count, stco[0] + 8).astype(np.int64)
+    run_count = int.from_bytes(data[stsc[0] + 4:stsc[0] + 8], 'big')
+    runs = np.frombuffer(data, '>u4', run_count * 3, stsc[0] + 8).reshape(-1, 3).astype(np.int64)
+
+    ends = np.empty(count, np.int64)
+    sample = 0
+    for i, (first_chunk, per_chunk, _) in enumerate(runs):
+        last_chunk = runs[i + 1][0] - 1 if i + 1 < len(runs) else chunk_count
+        for chunk in range(first_chunk - 1, min(last_chunk, chunk_count)):
+            taken = min(per_chunk, count - sample)
+            ends[sample:sample + taken] = offsets[chunk] + np.cumsum(sizes[sample:sample + taken])
+            sample += taken
+    if sample != count:
+        return None
+    return np.maximum.accumulate(ends)
+
+def mp4_video_sample_ends(path, header_end):
+    # Returns the file offset at which each sample of the first video track
+    # ends, in decode order (running maximum), or None if the sample table
+    # cannot be read. header_end is where the media data starts; the moov box
+    # is complete before it.
+    with open(path, 'rb') as f:
+        data = f.read(header_end)
     try:
-        response = requests.get(url)
-        if response.status_code != 200:
-            raise Exception("Failed to download Vimeo video")
-        with open(filename, 'wb') as f:
-            f.write(response.content)
+        moov = _mp4_child(data, 0, len(data), b'moov')
+        if moov is None:
+            return None
+        for box_type, trak_start, trak_end in _mp4_boxes(data, *moov):
+            if box_type != b'trak':
+                continue
+            mdia = _mp4_child(data, trak_start, trak_end, b'mdia')
+            hdlr = mdia and _mp4_child(data, *mdia, b'hdlr')
+            if hdlr is None or data[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+                continue
+            minf = _mp4_child(data, *mdia, b'minf')
+            stbl = minf and _mp4_child(data, *minf, b'stbl')
+            return _mp4_sample_ends(data, stbl) if stbl else None
+    except ValueError as e:
+        logging.warning(f"Could not read the MP4 sample table of {path}: {str(e)}")
+    return None
+
+def wait_for_frame_data(download, frame_index, stop_event, cancel_event=None):
+    # Waits until frame frame_index, the samples the decoder reads ahead and a
+    # safety margin have been downloaded.
+    end = download.layout[1] or download.total
+    sample_ends = download.sample_ends
+    needed = int(sample_ends[min(frame_index + DECODE_LOOKAHEAD, len(sample_ends) - 1)]) + DOWNLOAD_READ_MARGIN
+    if end:
+        needed = min(needed, end)
+    download.wait_until(lambda: download.bytes_done >= needed, stop_event, cancel_event)
+
+def wait_for_container(download, stop_event, cancel_event=None):
+    # Waits until the container header and the first frames are on disk and
+    # records the media data layout and the video sample positions on the
+    # download. The layout stays None when decoding has to wait for the whole
+    # file: the file is not fast-start, or its sample table cannot be read
+    # (guessing frame positions decodes partially downloaded samples).
+    layout = None
+
+    def ready():
+        nonlocal layout
+        layout = mp4_media_layout(download.path)
+        return layout is False or (layout is not None
+                                   and download.bytes_done >= layout[0] + DOWNLOAD_READ_MARGIN)
+
+    if not download.wait_until(ready, stop_event, cancel_event) or layout is False:
+        download.wait_finished(stop_event, cancel_event)
+        layout = None
+    if layout is not None:
+        download.sample_ends = mp4_video_sample_ends(download.path, layout[0])
+        if download.sample_ends is None or not len(download.sample_ends):
+            download.wait_finished(stop_event, cancel_event)
+            layout = None
+    download.layout = layout
+
+# Streaming video pipeline: decode -> detect/blur -> encode, joined by bounded
+# queues so only a handful of frames are ever held in memory at once.
+STREAM_QUEUE_SIZE = 16
+_END_OF_STREAM = object()
+
+class PipelineAborted(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+PROGRESS_EVERY = 10
+
+def _queue_put(q, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise PipelineAborted()
+
+def _queue_get(q, stop_event, cancel_event=None):
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled()
+            if stop_event.is_set():
+                raise PipelineAborted()
+
+# Video encoders. Both take BGR frames of a fixed size. The ffmpeg encoder runs
+# as a separate process fed through a pipe, so encoding overlaps detection and
+# blurring; it copies the source's first audio track into the output. When the
+# source is still being downloaded as encoding starts, the video is encoded
+# first and the audio is muxed in once the download has finished.
+class OpenCVEncoder:
+    def __init__(self, output_path, width, height, fps, options=None, audio_source=None):
+        self.writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        if not self.writer.isOpened():
+            raise Exception(f"Failed to open video writer for {output_path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+    def abort(self):
+        self.writer.release()
+
+class FFmpegEncoder:
+    def __init__(self, output_path, width, height, fps, options=None, audio_source=None):
+        options = options or {}
+        command = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', repr(float(fps)),
+                   '-i', 'pipe:0']
+        if audio_source is not None:
+            command += ['-i', audio_source, '-map', '0:v:0', '-map', '1:a:0?', '-c:a', 'copy']
+        if width % 2 or height % 2:
+            # yuv420p needs even dimensions.
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        command += ['-c:v', options.get('codec', VIDEO_CODEC), '-crf', str(options.get('crf', VIDEO_CRF)),
+                    '-preset', options.get('preset', VIDEO_PRESET), '-pix_fmt', 'yuv420p']
+        if os.path.splitext(output_path)[1].lower() in ('.mp4', '.mov', '.m4v'):
+            command += ['-movflags', '+faststart']
+        command.append(output_path)
+        self.stderr = tempfile.TemporaryFile()
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                            stderr=self.stderr)
+        except OSError as e:
+            self.stderr.close()
+            raise Exception(f"Failed to start {FFMPEG_BINARY}: {str(e)}")
+
+    def _error(self):
+        self.stderr.seek(0)
+        message = self.stderr.read().decode(errors='replace').strip()
+        return Exception(f"ffmpeg failed with exit code {self.process.returncode}: {message}")
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            self.process.wait()
+            raise self._error()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            if self.process.wait() != 0:
+                raise self._error()
+        finally:
+            self.stderr.close()
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+        self.stderr.close()
+
+VIDEO_ENCODERS = {'auto': None, 'ffmpeg': FFmpegEncoder, 'opencv': OpenCVEncoder}
+
+def resolve_video_encoder(name):
+    if name == 'auto':
+        return 'ffmpeg' if shutil.which(FFMPEG_BINARY) else 'opencv'
+    return name
+
+def mux_audio(video_path, audio_source):
+    # Copies the first audio track of audio_source, if any, into video_path.
+    muxed_path = f"{video_path}.mux{os.path.splitext(video_path)[1]}"
+    command = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y', '-i', video_path, '-i', audio_source,
+               '-map', '0:v:0', '-map', '1:a:0?', '-c', 'copy']
+    if os.path.splitext(video_path)[1].lower() in ('.mp4', '.mov', '.m4v'):
+        command += ['-movflags', '+faststart']
+    command.append(muxed_path)
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception(f"ffmpeg failed with exit code {result.returncode}: "
+                            f"{result.stderr.decode(errors='replace').strip()}")
+        os.replace(muxed_path, video_path)
     except Exception as e:
-        logging.error(f"An error occurred while downloading the Vimeo video: {str(e)}")
+        logging.error(f"An error occurred while muxing the audio track: {str(e)}")
+        if os.path.exists(muxed_path):
+            os.remove(muxed_path)
         raise
 
-def extract_frames(video_path):
+def decode_frames(video_path, frame_queue, stop_event, errors, info=None, cancel_event=None, download=None,
+                  metrics=None):
+    cap = None
+    decode_seconds = 0.0
     try:
+        if download is not None:
+            wait_for_container(download, stop_event, cancel_event)
+            if download.layout is None:
+                download = None
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise Exception(f"Failed to open video file: {video_path}")
-        frames = []
-        while cap.isOpened():
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        if info is not None:
+            info["total_frames"] = total_frames
+            info["fps"] = cap.get(cv2.CAP_PROP_FPS) or None
+        streamed = download is not None
+        frame_index = 0
+        while not stop_event.is_set():
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled()
+            if download is not None and not download.finished:
+                wait_for_frame_data(download, frame_index, stop_event, cancel_event)
+            started = time.perf_counter()
             ret, frame = cap.read()
+            decode_seconds += time.perf_counter() - started
             if not ret:
+                if download is None:
+                    break
+                # The decoder hit the end of the partial file, not of the
+                # video: wait for more data, reopen and seek back to the frame.
+                # The last reopen happens on the complete file.
+                if download.finished:
+                    download = None
+                else:
+                    bytes_done = download.bytes_done
+                    download.wait_until(lambda: download.bytes_done > bytes_done, stop_event, cancel_event)
+                cap.release()
+                cap = cv2.VideoCapture(video_path)
+                if not cap.isOpened():
+                    raise Exception(f"Failed to reopen video file: {video_path}")
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                continue
+            frame_index += 1
+            _queue_put(frame_queue, frame, stop_event)
+        if streamed and not stop_event.is_set() and total_frames and frame_index < total_frames:
+            raise Exception(f"Decoded only {frame_index} of {total_frames} frames from {video_path}")
+        _queue_put(frame_queue, _END_OF_STREAM, stop_event)
+    except PipelineAborted:
+        pass
+    except JobCancelled as e:
+        errors.append(e)
+        stop_event.set()
+    except Exception as e:
+        logging.error(f"An error occurred while decoding frames: {str(e)}")
+        errors.append(e)
+        stop_event.set()
+    finally:
+        if cap is not None:
+            cap.release()
+        if metrics is not None:
+            metrics.add_time('decode', decode_seconds)
+
+def encode_frames(output_path, frame_queue, stop_event, errors, fps=None, progress=None, info=None,
+                  cancel_event=None, metrics=None, options=None, source_path=None, download=None):
+    # fps=None keeps the frame rate the decoder read from the source.
+    options = options or {}
+    encoder_name = resolve_video_encoder(options.get('encoder', VIDEO_ENCODER))
+    video_out = None
+    mux_source = None
+    written = 0
+    encode_seconds = 0.0
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled()
+            frame = _queue_get(frame_queue, stop_event, cancel_event)
+            if frame is _END_OF_STREAM:
                 break
-            frames.append(frame)
-        cap.release()
-        return frames
+            started = time.perf_counter()
+            if video_out is None:
+                height, width = frame.shape[:2]
+                frame_rate = fps or (info or {}).get("fps") or DEFAULT_FPS
+                audio_source = None
+                if encoder_name == 'ffmpeg' and source_path is not None:
+                    if download is None or download.finished:
+                        audio_source = source_path
+                    else:
+                        mux_source = source_path
+                video_out = VIDEO_ENCODERS[encoder_name](output_path, width, height, frame_rate, options,
+                                                         audio_source)
+                if info is not None:
+                    info["encoder"] = encoder_name
+            video_out.write(frame)
+            encode_seconds += time.perf_counter() - started
+            written += 1
+            if progress is not None and written % PROGRESS_EVERY == 0:
+                progress(written, (info or {}).get("total_frames"))
+        if video_out is not None:
+            started = time.perf_counter()
+            finishing, video_out = video_out, None
+            finishing.close()
+            encode_seconds += time.perf_counter() - started
+        if mux_source is not None:
+            download.wait_finished(stop_event, cancel_event)
+            started = time.perf_counter()
+            mux_audio(output_path, mux_source)
+            if metrics is not None:
+                metrics.add_time('mux', time.perf_counter() - started)
+        if progress is not None:
+            progress(written, written)
+    except PipelineAborted:
+        pass
+    except JobCancelled as e:
+        errors.append(e)
+        stop_event.set()
     except Exception as e:
-        logging.error(f"An error occurred while extracting frames: {str(e)}")
-        raise
+        logging.error(f"An error occurred while encoding frames: {str(e)}")
+        errors.append(e)
+        stop_event.set()
+    finally:
+        if video_out is not None:
+            video_out.abort()
+        if metrics is not None:
+            metrics.add_time('encode', encode_seconds)
+
+# Detection scheduling: run the detector on every Nth frame and carry the boxes
+# across the frames in between with sparse optical flow. Detection is rerun
+# early as soon as any box can no longer be tracked confidently.
+def track_boxes(prev_gray, gray, boxes, min_confidence=TRACK_MIN_CONFIDENCE):
+    tracked = []
+    for (startX, startY, endX, endY) in boxes:
+        roi = prev_gray[max(0, startY):endY, max(0, startX):endX]
+        if roi.size == 0:
+            return None
+        points = cv2.goodFeaturesToTrack(roi, maxCorners=30, qualityLevel=0.01, minDistance=3)
+        if points is None or len(points) < 4:
+            return None
+        points = points + np.array([max(0, startX), max(0, startY)], dtype=np.float32)
+
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, next_points, None)
+        back_error = np.linalg.norm(points - back_points, axis=2).ravel()
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (back_error < 1.0)
+        if good.sum() < 3 or good.mean() < min_confidence:
+            return None
+
+        dx, dy = np.median((next_points - points)[good].reshape(-1, 2), axis=0)
+        tracked.append((int(round(startX + dx)), int(round(startY + dy)),
+                        int(round(endX + dx)), int(round(endY + dy))))
+    return tracked
+
+# Scene-aware skipping. A frame's signature is its mean colour over a coarse
+# grid of cells. Static frames are compared with the frame the current boxes
+# were found on rather than with the previous frame, so slow changes still add
+# up to a new detection.
+SIGNATURE_GRID = (32, 18)
+
+def frame_signature(frame):
+    # Subsampled first so the cost does not grow with the resolution.
+    step = max(1, min(frame.shape[0] // (SIGNATURE_GRID[1] * 8), frame.shape[1] // (SIGNATURE_GRID[0] * 8)))
+    return cv2.resize(frame[::step, ::step], SIGNATURE_GRID, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def signature_change(signature, reference):
+    # The largest change of any cell and the mean change over the frame.
+    diff = np.abs(signature - reference)
+    return int(diff.max()), float(diff.mean())
+
+def is_scene_cut(signature, previous):
+    return previous is not None and signature_change(signature, previous)[1] > SCENE_CUT_THRESHOLD
+
+class FrameProcessor:
+    # Runs the detector on every frame, or with a static_threshold only on the
+    # frames that changed.
+    def __init__(self, detect, options=None):
+        self.detect = detect
+        self.options = options
+        self.static_threshold = (options or {}).get('static_threshold', 0)
+        self.stats = {"detections": 0, "detect_seconds": 0.0, "blur_seconds": 0.0}
+        if self.static_threshold:
+            self.stats.update({"skipped_frames": 0, "scene_cuts": 0})
+        self.reset()
+
+    def reset(self):
+        self.boxes = []
+        self.reference = None
+        self.previous = None
+
+    def _detection_sources(self, frames):
+        # For each frame, the index of the frame in the batch whose boxes it
+        # uses, or None for the boxes carried over from the previous batch.
+        sources = []
+        for i, frame in enumerate(frames):
+            signature = frame_signature(frame)
+            if is_scene_cut(signature, self.previous):
+                self.stats["scene_cuts"] += 1
+                changed = True
+            else:
+                changed = (self.reference is None
+                           or signature_change(signature, self.reference)[0] > self.static_threshold)
+            if changed:
+                self.reference = signature
+                sources.append(i)
+            else:
+                sources.append(sources[-1] if sources else None)
+            self.previous = signature
+        return sources
+
+    def _detect_changed(self, frames):
+        sources = self._detection_sources(frames)
+        indices = [i for i, source in enumerate(sources) if source == i]
+        found = dict(zip(indices, self.detect([frames[i] for i in indices]) if indices else []))
+        boxes = [self.boxes if source is None else found[source] for source in sources]
+        self.boxes = boxes[-1]
+        self.stats["skipped_frames"] += len(frames) - len(indices)
+        return boxes
+
+    def __call__(self, frames):
+        started = time.perf_counter()
+        boxes = self._detect_changed(frames) if self.static_threshold else self.detect(frames)
+        detected = time.perf_counter()
+        results = [blur_boxes(frame, frame_boxes, self.options) for frame, frame_boxes in zip(frames, boxes)]
+        self.stats["detect_seconds"] += detected - started
+        self.stats["blur_seconds"] += time.perf_counter() - detected
+        self.stats["detections"] += sum(len(frame_boxes) for frame_boxes in boxes)
+        return results
+
+class TrackedDetector:
+    def __init__(self, detect, detect_every, min_confidence=TRACK_MIN_CONFIDENCE, options=None):
+        self.detect = detect
+        self.detect_every = detect_every
+        self.options = options
+        self.min_confidence = min_confidence
+        self.static_threshold = (options or {}).get('static_threshold', 0)
+        self.stats = {"detected_frames": 0, "tracked_frames": 0, "detections": 0,
+                      "detect_seconds": 0.0, "track_seconds": 0.0, "blur_seconds": 0.0}
+        if self.static_threshold:
+            self.stats.update({"skipped_frames": 0, "scene_cuts": 0})
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.boxes = []
+        self.since_detection = 0
+        self.reference = None
+        self.previous = None
+
+    def _is_static(self, frame):
+        # A static frame keeps the current boxes; the tracker's reference
+        # frame stays the one the boxes were found on. Returns whether the
+        # frame is static and whether it starts a new scene.
+        signature = frame_signature(frame)
+        scene_cut = is_scene_cut(signature, self.previous)
+        self.previous = signature
+        if scene_cut:
+            self.stats["scene_cuts"] += 1
+        elif self.reference is not None and signature_change(signature, self.reference)[0] <= self.static_threshold:
+            self.stats["skipped_frames"] += 1
+            return True, False
+        self.reference = signature
+        return False, scene_cut
+
+    def __call__(self, frames):
+        results = []
+        for frame in frames:
+            started = time.perf_counter()
+            static, scene_cut = self._is_static(frame) if self.static_threshold else (False, False)
+            if static:
+                boxes = self.boxes
+                self.stats["track_seconds"] += time.perf_counter() - started
+            else:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                boxes = None
+                if self.prev_gray is not None and not scene_cut and self.since_detection < self.detect_every:
+                    boxes = track_boxes(self.prev_gray, gray, self.boxes, self.min_confidence)
+                tracked = time.perf_counter()
+                self.stats["track_seconds"] += tracked - started
+                if boxes is None:
+                    boxes = self.detect([frame])[0]
+                    self.since_detection = 0
+                    self.stats["detected_frames"] += 1
+                    self.stats["detect_seconds"] += time.perf_counter() - tracked
+                else:
+                    self.stats["tracked_frames"] += 1
+                self.since_detection += 1
+                self.boxes = boxes
+                self.prev_gray = gray
+            self.stats["detections"] += len(boxes)
+            started = time.perf_counter()
+            results.append(blur_boxes(frame, boxes, self.options))
+            self.stats["blur_seconds"] += time.perf_counter() - started
+        return results
+
+# Frame tasks are described by a (task, params) pair rather than a callable so
+# the same description can be shipped to worker processes. Detectors and
+# processors take a list of frames, so detectors that support it
+# (the Caffe face SSD) can run a whole batch at once. Detectors return one list
+# of boxes per frame; processors return the blurred frames.
+def make_face_detector(options):
+    net = get_model('face_detector')
+    if options.get('tiled'):
+        return lambda frames: detect_faces_tiled(net, frames)
+    return lambda frames: detect_faces_batch(net, frames)
+
+def make_box_detector(task, params=None, options=None):
+    options = options or {}
+    if task == 'faces':
+        return make_face_detector(options)
+    if task == 'eyes':
+        eye_mode = options.get('eye_mode', EYE_MODE)
+        eye_cascade = get_model('eye_detector') if eye_mode != 'geometry' else None
+        if eye_mode == 'frame':
+            return lambda frames: [detect_eyes(eye_cascade, frame) for frame in frames]
+        detect_faces = make_face_detector(options)
+        return lambda frames: [detect_eyes_in_faces(eye_cascade, frame, faces, eye_mode)
+                               for frame, faces in zip(frames, detect_faces(frames))]
+    if task == 'person':
+        scale = options.get('detection_scale', 1.0)
+        return lambda frames: [detect_specific_person(frame, params, scale) for frame in frames]
+    raise ValueError(f"Unknown frame task: {task}")
+
+def make_frame_processor(task, params=None, options=None):
+    options = options or {}
+    detect = make_box_detector(task, params, options)
+    detect_every = options.get('detect_every', 1)
+    if detect_every > 1:
+        return TrackedDetector(detect, detect_every, options=options)
+    return FrameProcessor(detect, options)
+
+def _merge_stats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+def _stats_since(processor, before):
+    stats = getattr(processor, 'stats', {})
+    return {key: value - before.get(key, 0) for key, value in stats.items()}
+
+def _next_batch(decoded, stop_event, batch_size):
+    batch = []
+    while len(batch) < batch_size:
+        frame = _queue_get(decoded, stop_event)
+        if frame is _END_OF_STREAM:
+            return batch, True
+        batch.append(frame)
+    return batch, False
+
+def _run_serial_stage(decoded, processed, stop_event, task, params, options, batch_size):
+    process_frames = make_frame_processor(task, params, options)
+    frame_count = 0
+    finished = False
+    while not finished:
+        batch, finished = _next_batch(decoded, stop_event, batch_size)
+        if batch:
+            for frame in process_frames(batch):
+                _queue_put(processed, frame, stop_event)
+            frame_count += len(batch)
+    _queue_put(processed, _END_OF_STREAM, stop_event)
+    return frame_count, dict(getattr(process_frames, 'stats', {}))
+
+# Multi-process frame stage. Each worker loads its detector once in the pool
+# initializer; batches of frames travel through a ring of shared memory slots
+# so only the slot name crosses the process boundary, and results are
+# collected in submission order.
+_worker_processor = None
+_worker_buffers = {}
+
+def _init_frame_worker(task, params, options):
+    global _worker_processor
+    _worker_processor = make_frame_processor(task, params, options)
+
+def _process_shared_frames(slot_name, count, shape, dtype):
+    shm = _worker_buffers.get(slot_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=slot_name)
+        _worker_buffers[slot_name] = shm
+    frames = np.ndarray((count,) + tuple(shape), dtype=dtype, buffer=shm.buf)
+    batch = [frames[i] for i in range(count)]
+
+    # Batches handed to one worker are not contiguous, so per-stream state
+    # such as tracked boxes starts fresh with every batch.
+    if hasattr(_worker_processor, 'reset'):
+        _worker_processor.reset()
+    before = dict(getattr(_worker_processor, 'stats', {}))
+    for i, result in enumerate(_worker_processor(batch)):
+        if result is not batch[i]:
+            frames[i] = result
+    return _stats_since(_worker_processor, before)
+
+def _write_slot(shm, batch):
+    frames = np.ndarray((len(batch),) + batch[0].shape, dtype=batch[0].dtype, buffer=shm.buf)
+    for i, frame in enumerate(batch):
+        frames[i] = frame
+
+def _read_slot(shm, count, shape, dtype):
+    frames = np.ndarray((count,) + tuple(shape), dtype=dtype, buffer=shm.buf)
+    return [frames[i].copy() for i in range(count)]
+
+# Starting spawn processes and loading their detectors takes longer than a
+# short clip does to process, so pools are kept between requests. A request
+# checks a pool out for the length of its stream and returns it when the
+# stream ends cleanly; concurrent requests with the same settings start a
+# second pool. The slots stay with the pool, so the workers' mappings of
+# them stay valid.
+class _FramePool:
+    def __init__(self, key, task, params, options, workers):
+        self.key = key
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_frame_worker, initargs=(task, params, options))
+        self.slots = []
+        self.slot_count = workers * 2
+
+    def ensure_slots(self, size):
+        # False when the existing slots are too small for this stream.
+        if self.slots:
+            return self.slots[0].size >= size
+        for _ in range(self.slot_count):
+            self.slots.append(shared_memory.SharedMemory(create=True, size=size))
+        return True
+
+    def close(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
+        self.slots = []
+
+_idle_frame_pools = deque()
+_frame_pools_lock = threading.Lock()
+
+def _frame_pool_key(task, params, options, workers):
+    payload = pickle.dumps((task, params, options, workers))
+    return hashlib.sha256(payload).hexdigest()
+
+def _check_out_frame_pool(task, params, options, workers):
+    key = _frame_pool_key(task, params, options, workers)
+    with _frame_pools_lock:
+        for pool in _idle_frame_pools:
+            if pool.key == key:
+                _idle_frame_pools.remove(pool)
+                return pool
+    return _FramePool(key, task, params, options, workers)
+
+def _return_frame_pool(pool):
+    evicted = []
+    with _frame_pools_lock:
+        _idle_frame_pools.append(pool)
+        while len(_idle_frame_pools) > FRAME_POOL_LIMIT:
+            evicted.append(_idle_frame_pools.popleft())
+    for pool in evicted:
+        pool.close()
+
+@atexit.register
+def _close_idle_frame_pools():
+    with _frame_pools_lock:
+        pools = list(_idle_frame_pools)
+        _idle_frame_pools.clear()
+    for pool in pools:
+        pool.close()
+
+def _run_parallel_stage(decoded, processed, stop_event, task, params, options, workers, batch_size):
+    pool = _check_out_frame_pool(task, params, options, workers)
+    free_slots = deque()
+    in_flight = deque()
+    frame_count = 0
+    stage_stats = {}
+    completed = False
+
+    def collect_oldest():
+        future, shm, count, shape, dtype = in_flight.popleft()
+        _merge_stats(stage_stats, future.result())
+        results = _read_slot(shm, count, shape, dtype)
+        free_slots.append(shm)
+        for frame in results:
+            _queue_put(processed, frame, stop_event)
 
-def reassemble_video(frames, output_path, fps=30):
     try:
-        height, width, _ = frames[0].shape
-        video_out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-        for frame in frames:
-            video_out.write(frame)
-        video_out.release()
+        finished = False
+        while not finished:
+            batch, finished = _next_batch(decoded, stop_event, batch_size)
+            if not batch:
+                break
+            frame = batch[0]
+            if frame_count == 0:
+                # Workers keep the slots mapped, so a pool whose slots are
+                # too small for this stream is replaced rather than resized.
+                if not pool.ensure_slots(frame.nbytes * batch_size):
+                    pool.close()
+                    pool = _FramePool(pool.key, task, params, options, workers)
+                    pool.ensure_slots(frame.nbytes * batch_size)
+                free_slots.extend(pool.slots)
+            if any(f.shape != frame.shape for f in batch) or frame.nbytes * len(batch) > pool.slots[0].size:
+                raise Exception("Frame size changed mid-stream")
+            if not free_slots:
+                collect_oldest()
+            shm = free_slots.popleft()
+            _write_slot(shm, batch)
+            future = pool.executor.submit(_process_shared_frames, shm.name, len(batch), frame.shape,
+                                          frame.dtype.str)
+            in_flight.append((future, shm, len(batch), frame.shape, frame.dtype))
+            frame_count += len(batch)
+        while in_flight:
+            collect_oldest()
+        completed = True
+        _queue_put(processed, _END_OF_STREAM, stop_event)
+    finally:
+        if completed:
+            _return_frame_pool(pool)
+        else:
+            # Futures may still be using the slots, and the pool may be broken.
+            pool.close(wait=True)
+    return frame_count, stage_stats
+
+# Picture pipeline. The images of an uploaded zip are handed out in batches to
+# a pool of threads (OpenCV releases the GIL while decoding, detecting and
+# encoding) or, for the person task whose face_recognition calls hold the GIL,
+# to worker processes. Each worker decodes, blurs and re-encodes its batch;
+# results are yielded in submission order so the output zip is deterministic.
+_image_executor = None
+_image_executor_lock = threading.Lock()
+
+def _get_image_executor():
+    # Shared so each thread keeps its per-thread model copies across requests.
+    global _image_executor
+    with _image_executor_lock:
+        if _image_executor is None:
+            _image_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='blur-image')
+        return _image_executor
+
+def _blur_encoded_images(processor, entries):
+    # Returns the blurred entries and the batch's stats.
+    before = dict(getattr(processor, 'stats', {}))
+    started = time.perf_counter()
+    decoded = [(file_name, decode_image(file_name, data)) for file_name, data in entries]
+    decoded = [(file_name, image) for file_name, image in decoded if image is not None]
+    stats = {"images": len(decoded), "decode_seconds": time.perf_counter() - started}
+    if not decoded:
+        return [], stats
+    images = processor([image for _, image in decoded])
+    started = time.perf_counter()
+    results = []
+    for (file_name, _), image in zip(decoded, images):
+        name, ext = os.path.splitext(file_name)
+        results.append((f"blurred_images/{name}_blur{ext}", encode_image(image, ext)))
+    stats["encode_seconds"] = time.perf_counter() - started
+    _merge_stats(stats, _stats_since(processor, before))
+    return results, stats
+
+def _blur_encoded_images_in_thread(task, params, options, entries, profiler=None):
+    with profiling(profiler):
+        return _blur_encoded_images(make_frame_processor(task, params, options), entries)
+
+_person_executor = None
+
+def _get_person_executor():
+    # Long-lived like the image executor: starting processes and loading dlib
+    # in each of them takes longer than a small zip does to process. Workers
+    # build the processor for each batch; their models stay loaded.
+    global _person_executor
+    with _image_executor_lock:
+        if _person_executor is None:
+            _person_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        return _person_executor
+
+def _discard_person_executor(executor):
+    # A pool whose worker died is unusable; the next request starts a new one.
+    global _person_executor
+    with _image_executor_lock:
+        if _person_executor is executor:
+            _person_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _zip_batches(archive, infos, batch_size, metrics=None):
+    for i in range(0, len(infos), batch_size):
+        started = time.perf_counter()
+        batch = [(info.filename, archive.read(info)) for info in infos[i:i + batch_size]]
+        if metrics is not None:
+            metrics.add_time('unzip', time.perf_counter() - started)
+        yield batch
+
+def process_zip_images(archive, task, params=None, options=None, workers=1, batch_size=1, metrics=None,
+                       profiler=None):
+    # Yields (entry name, encoded bytes) for each blurred image. Pictures are
+    # independent, so there is no tracking between them.
+    options = dict(options or {}, detect_every=1, static_threshold=0)
+    infos = zip_image_infos(archive)
+    batches = _zip_batches(archive, infos, batch_size, metrics)
+    workers = max(1, min(workers, -(-len(infos) // batch_size)))
+
+    def collect(batch_result):
+        results, stats = batch_result
+        if metrics is not None:
+            metrics.merge_stats(stats)
+        return results
+
+    if workers == 1:
+        processor = make_frame_processor(task, params, options)
+        for batch in batches:
+            yield from collect(_blur_encoded_images(processor, batch))
+        return
+
+    executor = None
+    if task == 'person':
+        executor = _get_person_executor()
+        submit = lambda batch: executor.submit(_blur_encoded_images_in_thread, task, params, options, batch)
+    else:
+        submit = lambda batch: _get_image_executor().submit(_blur_encoded_images_in_thread,
+                                                            task, params, options, batch, profiler)
+    in_flight = deque()
+    try:
+        for batch in batches:
+            if len(in_flight) >= workers:
+                yield from collect(in_flight.popleft().result())
+            in_flight.append(submit(batch))
+        while in_flight:
+            yield from collect(in_flight.popleft().result())
+    except BrokenProcessPool:
+        _discard_person_executor(executor)
+        raise
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+def process_video_stream(video_path, output_path, task, params=None, options=None, workers=1, batch_size=1,
+                         fps=None, queue_size=STREAM_QUEUE_SIZE, progress=None, cancel_event=None, download=None,
+                         metrics=None, profiler=None):
+    decoded = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+    info = {}
+    wrap = profiler.wrap if profiler is not None else (lambda target: target)
+    decoder = threading.Thread(target=wrap(decode_frames),
+                               args=(video_path, decoded, stop_event, errors, info, cancel_event, download, metrics),
+                               daemon=True)
+    encoder = threading.Thread(target=wrap(encode_frames),
+                               args=(output_path, processed, stop_event, errors, fps, progress, info, cancel_event,
+                                     metrics, options, video_path, download),
+                               daemon=True)
+    started = time.perf_counter()
+    decoder.start()
+    encoder.start()
+
+    frame_count = 0
+    stage_stats = {}
+    completed = False
+    try:
+        if workers > 1:
+            frame_count, stage_stats = _run_parallel_stage(decoded, processed, stop_event, task, params,
+                                                           options, workers, batch_size)
+        else:
+            frame_count, stage_stats = _run_serial_stage(decoded, processed, stop_event, task, params,
+                                                         options, batch_size)
+        completed = True
+    except PipelineAborted:
+        pass
     except Exception as e:
-        logging.error(f"An error occurred while reassembling video: {str(e)}")
+        logging.error(f"An error occurred while processing frames: {str(e)}")
+        errors.append(e)
+    finally:
+        if not completed:
+            stop_event.set()
+        decoder.join()
+        encoder.join()
+
+    if errors:
+        raise errors[0]
+    if frame_count == 0:
+        raise Exception(f"No frames could be decoded from video file: {video_path}")
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        "frames": frame_count,
+        "workers": workers,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "fps": round(frame_count / elapsed, 2) if elapsed > 0 else None,
+        "source_fps": info.get("fps"),
+        "encoder": info.get("encoder"),
+    }
+    stats.update({key: value for key, value in stage_stats.items() if not key.endswith('_seconds')})
+    if metrics is not None:
+        metrics.count('frames', frame_count)
+        metrics.merge_stats(stage_stats)
+    logging.info(f"Processed {frame_count} frames in {stats['seconds']}s "
+                 f"({stats['fps']} fps, {workers} worker(s))")
+    if "detected_frames" in stage_stats:
+        logging.info(f"Ran detection on {stage_stats['detected_frames']} frames, "
+                     f"tracked {stage_stats['tracked_frames']} frames")
+    if "skipped_frames" in stage_stats:
+        logging.info(f"Reused earlier detections on {stage_stats['skipped_frames']} static frames, "
+                     f"found {stage_stats['scene_cuts']} scene cuts")
+    return stats
+
+TASK_LABELS = {'faces': 'face', 'eyes': 'eye', 'person': 'specific person'}
+
+def validate_video_source(source_type, path_or_url):
+    if source_type not in ('youtube', 'vimeo', 'local'):
+        return "Invalid source type"
+    if source_type == 'local' and not os.path.exists(path_or_url):
+        return "Local file not found"
+    return None
+
+def video_source_hash(source_type, path_or_url):
+    # Local files are identified by their content. Remote videos are only
+    # identified by their URL, since their content is not known before they
+    # are downloaded.
+    if source_type == 'local':
+        return hash_file(path_or_url)
+    return result_cache_key('url', source_type, path_or_url)
+
+def run_video_job(task, params, source_type, path_or_url, output_filename, options, workers=1, batch_size=1,
+                  progress=None, cancel_event=None, cache_params=None, profile=False):
+    # The downloaded source and the output live in a workspace of their own.
+    # The source is always removed; the whole workspace is removed if the job
+    # fails or is cancelled, otherwise it holds the output until the job (or,
+    # for a synchronous request, the output) is pruned.
+    work_dir = create_workspace('video-')
+    output_path = workspace_file(work_dir, output_filename, 'blurred_video.mp4')
+    video_path = os.path.join(work_dir, 'source.mp4')
+    download = None
+    cache_key = None
+    metrics = RequestMetrics(f"{task}-video")
+    profiler = start_profiler({"profile": profile}, f"{task}-video", os.path.join(work_dir, 'profile'))
+    try:
+        if cache_params is not None and result_cache.enabled:
+            with metrics.stage('hash'):
+                source_hash = video_source_hash(source_type, path_or_url)
+            cache_key = result_cache_key(f"{task}-video", cache_params, source_hash)
+            cached_path = None if profiler else result_cache.get(cache_key)
+            if cached_path is not None:
+                logging.info(f"Serving cached result {cache_key}")
+                shutil.copyfile(cached_path, output_path)
+                return {"output_file": output_path, "stats": {"cached": True}, "metrics": metrics.finish('cached')}
+
+        if source_type == 'youtube':
+            download = download_youtube_video(path_or_url, video_path)
+        elif source_type == 'vimeo':
+            download = download_vimeo_video(path_or_url, video_path)
+        else:
+            logging.info(f"Using local video file: {path_or_url}")
+            video_path = path_or_url
+
+        logging.info(f"Streaming frames through {TASK_LABELS[task]} detection and blurring")
+        with profiling(profiler):
+            stats = process_video_stream(video_path, output_path, task, params, options, workers=workers,
+                                         batch_size=batch_size, progress=progress, cancel_event=cancel_event,
+                                         download=download, metrics=metrics, profiler=profiler)
+    except BaseException as e:
+        if download is not None:
+            download.stop()
+        remove_workspace(work_dir)
+        metrics.finish('cancelled' if isinstance(e, JobCancelled) else 'error')
+        if profiler is not None:
+            profiler.stop()
         raise
+    finally:
+        if download is not None:
+            download.stop()
+        if source_type in ['youtube', 'vimeo'] and os.path.exists(video_path):
+            os.remove(video_path)
+
+    logging.info("Video processed successfully")
+    if download is not None:
+        metrics.add_time('download', download.seconds)
+        metrics.add_bytes('in', download.bytes_done)
+    else:
+        metrics.add_bytes('in', os.path.getsize(video_path))
+    metrics.add_bytes('out', os.path.getsize(output_path))
+    if cache_key is not None:
+        result_cache.put_file(cache_key, output_path)
+    result = {"output_file": output_path, "stats": stats, "metrics": metrics.finish()}
+    if profiler is not None:
+        result["profile"] = profiler.finish()
+    return result
+
+# Background jobs: long-running video work is run on a small thread pool and
+# tracked in memory so clients can poll status, follow progress as server-sent
+# events, download the result, or cancel.
+JOB_WORKERS = int(os.environ.get('BLUR_JOB_WORKERS', '2'))
+JOB_RETENTION_SECONDS = int(os.environ.get('BLUR_JOB_RETENTION_SECONDS', '3600'))
+_JOB_FINAL_STATES = ('done', 'failed', 'cancelled')
+_jobs = {}
+_jobs_lock = threading.Lock()
+# Workspaces of synchronous video results, (finished, work_dir), oldest first.
+# Their output path is returned to the client, so they are kept as long as a
+# finished job is.
+_sync_outputs = deque()
+_job_executor = None
+
+def _get_job_executor():
+    global _job_executor
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='blur-job')
+        return _job_executor
+
+def _prune_jobs():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    with _jobs_lock:
+        expired = [job_id for job_id, job in _jobs.items()
+                   if job["status"] in _JOB_FINAL_STATES and (job["finished"] or 0) < cutoff]
+        expired_jobs = [_jobs.pop(job_id) for job_id in expired]
+        expired_dirs = [os.path.dirname(job["result"]["output_file"]) for job in expired_jobs if job["result"]]
+        while _sync_outputs and _sync_outputs[0][0] < cutoff:
+            expired_dirs.append(_sync_outputs.popleft()[1])
+    for work_dir in expired_dirs:
+        remove_workspace(work_dir)
+
+def submit_job(kind, fn, *args, **kwargs):
+    _prune_jobs()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+        "frames_done": 0,
+        "frames_total": None,
+        "fps": None,
+        "eta_seconds": None,
+        "result": None,
+        "error": None,
+        "cancel_event": threading.Event(),
+    }
+    with _jobs_lock:
+        _jobs[job["job_id"]] = job
+    job["future"] = _get_job_executor().submit(_run_job, job, fn, args, kwargs)
+    return job
+
+def _update_job_progress(job, frames_done, frames_total):
+    elapsed = time.time() - (job["started"] or time.time())
+    fps = frames_done / elapsed if elapsed > 0 else None
+    job["frames_done"] = frames_done
+    job["frames_total"] = frames_total
+    job["fps"] = round(fps, 2) if fps else None
+    if fps and frames_total:
+        job["eta_seconds"] = round(max(0, frames_total - frames_done) / fps, 1)
+
+def _run_job(job, fn, args, kwargs):
+    if job["cancel_event"].is_set():
+        return
+    job["status"] = "running"
+    job["started"] = time.time()
+    try:
+        job["result"] = fn(*args, progress=lambda done, total: _update_job_progress(job, done, total),
+                           cancel_event=job["cancel_event"], **kwargs)
+        job["status"] = "done"
+        job["eta_seconds"] = 0
+    except JobCancelled:
+        logging.info(f"Job {job['job_id']} cancelled")
+        job["status"] = "cancelled"
+    except Exception as e:
+        logging.error(f"Job {job['job_id']} failed: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished"] = time.time()
+
+def job_status(job):
+    return {key: value for key, value in job.items() if key not in ("cancel_event", "future")}
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def respond_with_video_job(run_async, task, params, source_type, path_or_url, output_filename, options,
+                           workers=1, batch_size=1, known_faces=None, profile=False):
+    args = (task, params, source_type, path_or_url, output_filename, options, workers, batch_size)
+    cache_params = {"options": options, "extension": os.path.splitext(output_filename or '')[1].lower(),
+                    "known_faces": known_faces}
+    if options.get('detect_every', 1) > 1 or options.get('static_threshold', 0) > 0:
+        # Tracking and static-frame state restart with every batch a worker
+        # process gets, so the output depends on how frames are split.
+        cache_params.update(workers=workers, batch_size=batch_size)
+    if run_async:
+        job = submit_job(task, run_video_job, *args, cache_params=cache_params, profile=profile)
+        job_id = job["job_id"]
+        logging.info(f"Accepted {task} job {job_id}")
+        return jsonify({
+            "message": "Job accepted",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events",
+            "result_url": f"/jobs/{job_id}/result",
+        }), 202
+    _prune_jobs()
+    result = run_video_job(*args, cache_params=cache_params, profile=profile)
+    with _jobs_lock:
+        _sync_outputs.append((time.time(), os.path.dirname(result["output_file"])))
+    return jsonify({"message": "Video processed successfully", **result}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job)), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        last_payload = None
+        while True:
+            status = job_status(job)
+            payload = json.dumps(status)
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+            if status["status"] in _JOB_FINAL_STATES:
+                return
+            time.sleep(1)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}", "status": job["status"]}), 409
+    output_file = job["result"]["output_file"]
+    return send_file(os.path.abspath(output_file), as_attachment=True, download_name=os.path.basename(output_file))
+
+@app.route('/jobs/<job_id>/profile', methods=['GET'])
+def job_profile(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}", "status": job["status"]}), 409
+    profile = job["result"].get("profile")
+    if profile is None:
+        return jsonify({"error": "Job was not profiled"}), 404
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_name in profile["files"]:
+            zipf.write(os.path.join(profile["dir"], file_name), file_name)
+    buffer.seek(0)
+    return send_file(buffer, mimetype='application/zip', as_attachment=True, download_name=f"profile-{job_id}.zip")
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] in _JOB_FINAL_STATES:
+        return jsonify({"error": f"Job is already {job['status']}", "status": job["status"]}), 409
+    job["cancel_event"].set()
+    if job["future"].cancel():
+        job["status"] = "cancelled"
+        job["finished"] = time.time()
+    return jsonify({"message": "Cancellation requested", "job_id": job_id}), 202
 
 @app.route('/blur-eyes', methods=['POST'])
 def blur_eyes_in_video():
@@ -399,46 +3353,23 @@ def blur_eyes_in_video():
         source_type = data.get('type')
         path_or_url = data.get('path/url')
         output_filename = data.get('output_filename', 'blurred_eyes_video.mp4')
+        workers = parse_worker_count(data.get('workers'))
+        options = parse_stream_options(data)
+        run_async = parse_flag(data.get('async'))
+        batch_size = parse_batch_size(data.get('batch_size'))
         if not source_type or not path_or_url:
             return jsonify({"error": "No source type or path/URL provided"}), 400
 
-        downloads_dir = 'downloads'
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
-
-        video_path = os.path.join(downloads_dir, 'video.mp4')
-        output_path = os.path.join(downloads_dir, output_filename)
-
-        if source_type == 'youtube':
-            logging.info(f"Downloading YouTube video from URL: {path_or_url}")
-            download_youtube_video(path_or_url, video_path)
-        elif source_type == 'vimeo':
-            logging.info(f"Downloading Vimeo video from URL: {path_or_url}")
-            download_vimeo_video(path_or_url, video_path)
-        elif source_type == 'local':
-            logging.info(f"Using local video file: {path_or_url}")
-            if not os.path.exists(path_or_url):
-                return jsonify({"error": "Local file not found"}), 400
-            video_path = path_or_url
-        else:
-            return jsonify({"error": "Invalid source type"}), 400
-
-        logging.info("Video downloaded successfully")
+        source_error = validate_video_source(source_type, path_or_url)
+        if source_error:
+            return jsonify({"error": source_error}), 400
 
-        logging.info("Extracting frames from video")
-        frames = extract_frames(video_path)
-        eye_cascade = load_eye_detector()
-        logging.info("Loaded eye detector model")
-        logging.info("Detecting and blurring eyes in frames")
-        blurred_frames = [detect_and_blur_eyes(eye_cascade, frame) for frame in frames]
-        logging.info("Reassembling video from blurred frames")
-        reassemble_video(blurred_frames, output_path)
-
-        if source_type in ['youtube', 'vimeo']:
-            os.remove(video_path)
-        logging.info("Video processed successfully")
-        return jsonify({"message": "Video processed successfully", "output_file": output_path}), 200
+        return respond_with_video_job(run_async, 'eyes', None, source_type, path_or_url, output_filename, options,
+                                      workers=workers, batch_size=batch_size,
+                                      profile=parse_flag(data.get('profile')))
 
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except HTTPError as e:
         logging.error(f"HTTP Error: {e.code} - {e.reason}")
         return jsonify({"error": f"HTTP Error: {e.code} - {e.reason}"}), 500
@@ -453,46 +3384,23 @@ def blur_faces_in_video():
         source_type = data.get('type')
         path_or_url = data.get('path/url')
         output_filename = data.get('output_filename', 'blurred_video.mp4')
+        workers = parse_worker_count(data.get('workers'))
+        options = parse_stream_options(data)
+        run_async = parse_flag(data.get('async'))
+        batch_size = parse_batch_size(data.get('batch_size'))
         if not source_type or not path_or_url:
             return jsonify({"error": "No source type or path/URL provided"}), 400
 
-        downloads_dir = 'downloads'
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
+        source_error = validate_video_source(source_type, path_or_url)
+        if source_error:
+            return jsonify({"error": source_error}), 400
 
-        video_path = os.path.join(downloads_dir, 'video.mp4')
-        output_path = os.path.join(downloads_dir, output_filename)
-
-        if source_type == 'youtube':
-            logging.info(f"Downloading YouTube video from URL: {path_or_url}")
-            download_youtube_video(path_or_url, video_path)
-        elif source_type == 'vimeo':
-            logging.info(f"Downloading Vimeo video from URL: {path_or_url}")
-            download_vimeo_video(path_or_url, video_path)
-        elif source_type == 'local':
-            logging.info(f"Using local video file: {path_or_url}")
-            if not os.path.exists(path_or_url):
-                return jsonify({"error": "Local file not found"}), 400
-            video_path = path_or_url
-        else:
-            return jsonify({"error": "Invalid source type"}), 400
-
-        logging.info("Video downloaded successfully")
-
-        logging.info("Extracting frames from video")
-        frames = extract_frames(video_path)
-        net = load_face_detector()
-        logging.info("Loaded face detector model")
-        logging.info("Detecting and blurring faces in frames")
-        blurred_frames = [detect_and_blur_faces(net, frame) for frame in frames]
-        logging.info("Reassembling video from blurred frames")
-        reassemble_video(blurred_frames, output_path)
-
-        if source_type in ['youtube', 'vimeo']:
-            os.remove(video_path)
-        logging.info("Video processed successfully")
-        return jsonify({"message": "Video processed successfully", "output_file": output_path}), 200
+        return respond_with_video_job(run_async, 'faces', None, source_type, path_or_url, output_filename, options,
+                                      workers=workers, batch_size=batch_size,
+                                      profile=parse_flag(data.get('profile')))
 
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except HTTPError as e:
         logging.error(f"HTTP Error: {e.code} - {e.reason}")
         return jsonify({"error": f"HTTP Error: {e.code} - {e.reason}"}), 500
@@ -506,52 +3414,30 @@ def blur_specific_person_in_video():
         source_type = request.form.get('type')
         path_or_url = request.form.get('path/url')
         output_filename = request.form.get('output_filename', 'blurred_person_video.mp4')
+        workers = parse_worker_count(request.form.get('workers'))
+        options = parse_stream_options(request.form)
+        run_async = parse_flag(request.form.get('async'))
         zip_file = request.files.get('zip_file')
+        profile_ids = parse_profile_ids(request.form.get('profile_id'))
 
-        if not source_type or not path_or_url or not zip_file:
-            return jsonify({"error": "Missing source type, path/URL, or zip file"}), 400
+        if not source_type or not path_or_url or not (zip_file or profile_ids):
+            return jsonify({"error": "Missing source type, path/URL, or zip file/profile ID"}), 400
+        missing = missing_profiles(profile_ids)
+        if missing:
+            return jsonify({"error": f"Profile not found: {', '.join(missing)}"}), 404
 
-        downloads_dir = 'downloads'
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
+        source_error = validate_video_source(source_type, path_or_url)
+        if source_error:
+            return jsonify({"error": source_error}), 400
 
-        video_path = os.path.join(downloads_dir, 'video.mp4')
-        output_path = os.path.join(downloads_dir, output_filename)
-        zip_path = os.path.join(downloads_dir, 'images.zip')
-        image_folder = os.path.join(downloads_dir, 'extracted_images')
+        gallery = get_known_gallery(profile_ids, zip_file)
 
-        zip_file.save(zip_path)
-        extract_zip(zip_path, image_folder)
-        known_encodings = load_face_encodings(image_folder)
-
-        if source_type == 'youtube':
-            logging.info(f"Downloading YouTube video from URL: {path_or_url}")
-            download_youtube_video(path_or_url, video_path)
-        elif source_type == 'vimeo':
-            logging.info(f"Downloading Vimeo video from URL: {path_or_url}")
-            download_vimeo_video(path_or_url, video_path)
-        elif source_type == 'local':
-            logging.info(f"Using local video file: {path_or_url}")
-            if not os.path.exists(path_or_url):
-                return jsonify({"error": "Local file not found"}), 400
-            video_path = path_or_url
-        else:
-            return jsonify({"error": "Invalid source type"}), 400
-
-        logging.info("Video downloaded successfully")
-
-        logging.info("Extracting frames from video")
-        frames = extract_frames(video_path)
-        logging.info("Detecting and blurring the specific person in frames")
-        blurred_frames = [detect_and_blur_specific_person(frame, known_encodings) for frame in frames]
-        logging.info("Reassembling video from blurred frames")
-        reassemble_video(blurred_frames, output_path)
-
-        if source_type in ['youtube', 'vimeo']:
-            os.remove(video_path)
-        logging.info("Video processed successfully")
-        return jsonify({"message": "Video processed successfully", "output_file": output_path}), 200
+        return respond_with_video_job(run_async, 'person', gallery, source_type, path_or_url, output_filename, options,
+                                      workers=workers, known_faces=gallery_content_hash(profile_ids, zip_file),
+                                      profile=parse_flag(request.form.get('profile')))
 
+    except InvalidRequest as e:
+        return jsonify({"error": str(e)}), 400
     except HTTPError as e:
         logging.error(f"HTTP Error: {e.code} - {e.reason}")
         return jsonify({"error": f"HTTP Error: {e.code} - {e.reason}"}), 500
@@ -559,5 +3445,15 @@ def blur_specific_person_in_video():
         logging.error(f"An error occurred: {str(e)}")
         return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
+# Spawned frame, PDF and picture workers import this module too; they load
+# only the models they use, so the warm-up runs in the server process alone.
+if (os.environ.get('BLUR_WARM_UP_ON_START') == '1' and multiprocessing.parent_process() is None
+        and __name__ != '__main__'):
+    start_warm_up()
+
 if __name__ == '__main__':
+    # debug=True serves from a reloader child process. The watcher process
+    # around it never serves requests, so only the child warms up.
+    if is_running_from_reloader():
+        start_warm_up()
     app.run(debug=True)
\ No newline at end of file
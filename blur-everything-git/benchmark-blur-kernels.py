@@ -0,0 +1,76 @@
+import argparse
+import importlib.util
+import json
+import os
+import time
+import numpy as np
+
+ROI_SIZES = [32, 64, 128, 256, 512, 1024]
+
+def load_app_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'all-of-it.py')
+    spec = importlib.util.spec_from_file_location('all_of_it', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def time_call(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+def benchmark_kernels(app, sizes, repeats):
+    rng = np.random.default_rng(0)
+    results = []
+    for size in sizes:
+        roi = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+        for name, kernel in app.ANONYMIZE_KERNELS.items():
+            seconds = time_call(lambda: kernel(roi), repeats)
+            results.append({"kernel": name, "roi": size, "ms": round(seconds * 1000, 3)})
+    return results
+
+def benchmark_merged_boxes(app, repeats):
+    # A 1080p frame with a cluster of heavily overlapping boxes, as produced
+    # when several detections land on the same face.
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    boxes = [(800 + i * 20, 300 + i * 10, 1200 + i * 20, 700 + i * 10) for i in range(6)]
+    results = []
+    for name in app.ANONYMIZE_KERNELS:
+        for merge_boxes in (False, True):
+            options = {"kernel": name, "merge_boxes": merge_boxes}
+            seconds = time_call(lambda: app.blur_boxes(frame.copy(), boxes, options), repeats)
+            results.append({"kernel": name, "merge_boxes": merge_boxes, "ms": round(seconds * 1000, 3)})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare anonymization kernels across ROI sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=ROI_SIZES)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--json', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    app = load_app_module()
+    kernels = benchmark_kernels(app, args.sizes, args.repeats)
+    merged = benchmark_merged_boxes(app, args.repeats)
+
+    names = list(app.ANONYMIZE_KERNELS)
+    print(f"{'roi':>6} " + " ".join(f"{name:>11}" for name in names) + "   (median ms)")
+    for size in args.sizes:
+        row = {r["kernel"]: r["ms"] for r in kernels if r["roi"] == size}
+        print(f"{size:>6} " + " ".join(f"{row[name]:>11.3f}" for name in names))
+
+    print("\n6 overlapping boxes on a 1080p frame (median ms)")
+    for name in names:
+        row = {r["merge_boxes"]: r["ms"] for r in merged if r["kernel"] == name}
+        print(f"{name:>11}: per box {row[False]:>9.3f}   merged mask {row[True]:>9.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"kernels": kernels, "merged_boxes": merged}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import importlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import cv2
+import fitz
+import numpy as np
+
+RESOLUTIONS = {'480p': (854, 480), '1080p': (1920, 1080), '4k': (3840, 2160)}
+FACE_SIZES = [24, 48, 96, 192, 384]
+ENTITIES = ["Alice Johnson", "Robert Chen", "Maria Garcia", "Acme Corporation", "Globex Industries",
+            "Initech", "London", "Berlin"]
+FILLER = ["the", "agreement", "between", "parties", "shall", "remain", "in", "force", "until", "notice"]
+
+def load_app_module():
+    # Imported by its real name from a directory on sys.path: spawned worker
+    # processes (video workers, person pictures, PDF page ranges) import the
+    # module by name to unpickle their tasks.
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    return importlib.import_module('all-of-it')
+
+# Peak RSS of this process while a benchmark runs, sampled from /proc where
+# available. Worker processes are not included.
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        scale = 1 if platform.system() == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+class RssSampler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, current_rss())
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss())
+
+def measure(name, calls, items_per_call=1, unit='items', repeats=1):
+    # calls is a list of zero-argument functions; each is timed separately.
+    latencies = []
+    try:
+        with RssSampler() as rss:
+            started = time.perf_counter()
+            for _ in range(repeats):
+                for call in calls:
+                    call_started = time.perf_counter()
+                    call()
+                    latencies.append(time.perf_counter() - call_started)
+            elapsed = time.perf_counter() - started
+    except Exception as e:
+        print(f"{name:<40} skipped: {e}")
+        return {"name": name, "error": str(e)}
+
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "name": name,
+        "calls": len(latencies),
+        "unit": unit,
+        "throughput": round(len(latencies) * items_per_call / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p90": round(float(np.percentile(latencies_ms, 90)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "max": round(float(latencies_ms.max()), 3),
+        },
+        "peak_rss_mb": round(rss.peak / 1024 ** 2, 1),
+    }
+    print(f"{name:<40} {result['throughput']:>10} {unit}/s   p50 {result['latency_ms']['p50']:>9} ms   "
+          f"p99 {result['latency_ms']['p99']:>9} ms   peak RSS {result['peak_rss_mb']} MB")
+    return result
+
+# Synthetic inputs
+def draw_face(image, center, size):
+    x, y = center
+    cv2.ellipse(image, (x, y), (size // 2, int(size * 0.65)), 0, 0, 360, (140, 170, 220), -1)
+    for dx in (-size // 5, size // 5):
+        eye = (x + dx, y - size // 8)
+        cv2.ellipse(image, eye, (max(2, size // 10), max(1, size // 18)), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(image, eye, max(1, size // 24), (40, 30, 20), -1)
+    cv2.ellipse(image, (x, y + size // 4), (max(2, size // 6), max(1, size // 16)), 0, 0, 180, (60, 60, 150), 2)
+
+def make_face_image(rng, width, height, face_sizes=FACE_SIZES):
+    image = rng.integers(40, 120, (height, width, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (0, 0), 3)
+    for size in face_sizes:
+        if size * 2 >= min(width, height):
+            continue
+        center = (int(rng.integers(size, width - size)), int(rng.integers(size, height - size)))
+        draw_face(image, center, size)
+    return image
+
+def make_image_zip(rng, count, width, height):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        for i in range(count):
+            zipf.writestr(f"image_{i:04d}.jpg", cv2.imencode('.jpg', make_face_image(rng, width, height))[1].tobytes())
+    return buffer.getvalue()
+
+def make_video(path, width, height, frames, fps=30):
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(40, 120, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    size = max(24, height // 6)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for i in range(frames):
+        frame = background.copy()
+        x = size + (width - 2 * size) * i // max(1, frames - 1)
+        draw_face(frame, (x, height // 2), size)
+        draw_face(frame, (width - x, height // 3), size // 2)
+        writer.write(frame)
+    writer.release()
+
+def make_pdf(path, pages, rng):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        y = 60
+        for _ in range(35):
+            words = [str(rng.choice(FILLER)) for _ in range(10)]
+            words[int(rng.integers(0, 10))] = str(rng.choice(ENTITIES))
+            page.insert_text((40, y), " ".join(words), fontsize=9)
+            y += 20
+    doc.save(path)
+
+# Benchmarks
+def benchmark_functions(app, work_dir, args):
+    rng = np.random.default_rng(0)
+    options = app.parse_stream_options({})
+    results = []
+    for resolution in args.resolutions:
+        width, height = RESOLUTIONS[resolution]
+        image_paths = []
+        for i in range(args.images):
+            image_path = os.path.join(work_dir, f"{resolution}_{i}.jpg")
+            cv2.imwrite(image_path, make_face_image(rng, width, height))
+            image_paths.append(image_path)
+        output_path = os.path.join(work_dir, 'output.jpg')
+
+        def calls(fn):
+            return [lambda image_path=image_path: fn(image_path) for image_path in image_paths]
+
+        def faces(image_path):
+            app.detect_and_blur_faces(app.get_model('face_detector'), image_path, output_path, options)
+
+        def eyes(image_path):
+            app.detect_and_blur_eyes(app.get_model('eye_detector'), image_path, output_path, options)
+
+        def person(image_path):
+            gallery = person_gallery(app, image_paths[0])
+            app.detect_and_blur_specific_person(image_path, output_path, gallery, options)
+
+        results.append(measure(f"detect_and_blur_faces {resolution}", calls(faces), unit='images', repeats=args.repeats))
+        results.append(measure(f"detect_and_blur_eyes {resolution}", calls(eyes), unit='images', repeats=args.repeats))
+        results.append(measure(f"detect_and_blur_specific_person {resolution}", calls(person), unit='images',
+                               repeats=args.repeats))
+
+    pdf_path = os.path.join(work_dir, 'document.pdf')
+    make_pdf(pdf_path, args.pages, rng)
+    results.append(measure(f"redact_text_in_pdf {args.pages} pages",
+                           [lambda: app.redact_text_in_pdf(pdf_path, os.path.join(work_dir, 'redacted.pdf'), ENTITIES)],
+                           items_per_call=args.pages, unit='pages', repeats=args.repeats))
+    return results
+
+_galleries = {}
+
+def person_gallery(app, reference_path):
+    if reference_path not in _galleries:
+        with open(reference_path, 'rb') as f:
+            _galleries[reference_path] = app.FaceGallery(app.load_reference_encodings([(reference_path, f.read())])[1])
+    return _galleries[reference_path]
+
+def post_ok(client, route, **kwargs):
+    response = client.post(route, **kwargs)
+    response.get_data()
+    if response.status_code != 200:
+        raise Exception(f"{route} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+def benchmark_routes(app, work_dir, args):
+    rng = np.random.default_rng(1)
+    client = app.app.test_client()
+    results = []
+
+    width, height = RESOLUTIONS['1080p']
+    images = make_image_zip(rng, args.images, width, height)
+    reference = make_image_zip(rng, 1, width, height)
+
+    def zip_upload(data):
+        return (io.BytesIO(data), 'images.zip')
+
+    # The routes cap workers at the CPU count, so only distinct effective
+    # counts are measured.
+    worker_counts = sorted({app.parse_worker_count(workers) for workers in args.workers})
+
+    routes = [
+        ('/blur-faces-in-pictures', lambda: {'zip_file': zip_upload(images)}),
+        ('/blur-eyes-in-pictures', lambda: {'zip_file': zip_upload(images)}),
+        ('/blur-specific-person-in-pictures', lambda: {'target_zip_file': zip_upload(images),
+                                                       'reference_zip_file': zip_upload(reference)}),
+    ]
+    for workers in worker_counts:
+        for route, form in routes:
+            results.append(measure(f"{route} ({args.images} x 1080p, {workers} workers)",
+                                   [lambda route=route, form=form, workers=workers:
+                                    post_ok(client, route, data={**form(), 'workers': str(workers)})],
+                                   items_per_call=args.images, unit='images', repeats=args.repeats))
+
+    # Page ranges only run in parallel from BLUR_PDF_PARALLEL_MIN_PAGES pages
+    # on, so the multi-worker case gets a document at least that long.
+    pdf_bytes = {}
+    for workers in worker_counts:
+        pages = args.pages if workers == 1 else max(args.pages, app.PDF_PARALLEL_MIN_PAGES)
+        if pages not in pdf_bytes:
+            pdf_path = os.path.join(work_dir, f"route_{pages}.pdf")
+            make_pdf(pdf_path, pages, rng)
+            with open(pdf_path, 'rb') as f:
+                pdf_bytes[pages] = f.read()
+        form = lambda pages=pages, workers=workers: {'pdf_file': (io.BytesIO(pdf_bytes[pages]), 'doc.pdf'),
+                                                     'instruction': 'redact everything', 'workers': str(workers)}
+        results.append(measure(f"/redact-pdf ({pages} pages, {workers} workers)",
+                               [lambda form=form: post_ok(client, '/redact-pdf', data=form())],
+                               items_per_call=pages, unit='pages', repeats=args.repeats))
+
+    for resolution in args.resolutions:
+        width, height = RESOLUTIONS[resolution]
+        video_path = os.path.abspath(os.path.join(work_dir, f"{resolution}.mp4"))
+        make_video(video_path, width, height, args.frames)
+        for workers in worker_counts:
+            body = {'type': 'local', 'path/url': video_path, 'workers': workers}
+            label = f"({args.frames} x {resolution}, {workers} workers)"
+            for route in ('/blur-faces', '/blur-eyes'):
+                results.append(measure(f"{route} {label}",
+                                       [lambda route=route, body=body: post_ok(client, route, json=body)],
+                                       items_per_call=args.frames, unit='frames', repeats=args.repeats))
+            form = lambda body=body: {**body, 'workers': str(body['workers']), 'zip_file': zip_upload(reference)}
+            results.append(measure(f"/blur-person {label}",
+                                   [lambda form=form: post_ok(client, '/blur-person', data=form())],
+                                   items_per_call=args.frames, unit='frames', repeats=args.repeats))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blurring and redaction pipelines on synthetic inputs.")
+    parser.add_argument('--suites', nargs='+', choices=['functions', 'routes'], default=['functions', 'routes'])
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument('--images', type=int, default=10, help="Images per resolution or zip")
+    parser.add_argument('--frames', type=int, default=30, help="Frames per synthetic video")
+    parser.add_argument('--pages', type=int, default=20, help="Pages per synthetic PDF")
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                        help="Worker counts for the routes that accept workers")
+    parser.add_argument('--json', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    app = load_app_module()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Every run measures real work: results and reference encodings go to
+        # scratch directories and the result cache is turned off.
+        app.WORKSPACE_ROOT = os.path.join(work_dir, 'workspaces')
+        app.PROFILES_DIR = os.path.join(work_dir, 'profiles')
+        app.result_cache = app.ResultCache(os.path.join(work_dir, 'cache'), 0)
+        if 'functions' in args.suites:
+            results.extend(benchmark_functions(app, work_dir, args))
+        if 'routes' in args.suites:
+            results.extend(benchmark_routes(app, work_dir, args))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "created": time.time(),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "opencv": cv2.__version__,
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+                "results": results,
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
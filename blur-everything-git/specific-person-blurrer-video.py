@@ -3,6 +3,8 @@ import cv2
 import numpy as np
 import os
 import logging
+import queue
+import threading
 import zipfile
 import face_recognition
 from pytube import YouTube
@@ -38,33 +40,109 @@ def download_vimeo_video(url, filename):
         logging.error(f"An error occurred while downloading the Vimeo video: {str(e)}")
         raise
 
-def extract_frames(video_path):
+# Streaming video pipeline: decode -> detect/blur -> encode, joined by bounded
+# queues so only a handful of frames are ever held in memory at once.
+STREAM_QUEUE_SIZE = 16
+_END_OF_STREAM = object()
+
+class PipelineAborted(Exception):
+    pass
+
+def _queue_put(q, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise PipelineAborted()
+
+def _queue_get(q, stop_event):
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop_event.is_set():
+                raise PipelineAborted()
+
+def decode_frames(video_path, frame_queue, stop_event, errors):
+    cap = cv2.VideoCapture(video_path)
     try:
-        cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise Exception(f"Failed to open video file: {video_path}")
-        frames = []
-        while cap.isOpened():
+        while not stop_event.is_set():
             ret, frame = cap.read()
             if not ret:
                 break
-            frames.append(frame)
-        cap.release()
-        return frames
+            _queue_put(frame_queue, frame, stop_event)
+        _queue_put(frame_queue, _END_OF_STREAM, stop_event)
+    except PipelineAborted:
+        pass
     except Exception as e:
-        logging.error(f"An error occurred while extracting frames: {str(e)}")
-        raise
+        logging.error(f"An error occurred while decoding frames: {str(e)}")
+        errors.append(e)
+        stop_event.set()
+    finally:
+        cap.release()
 
-def reassemble_video(frames, output_path, fps=30):
+def encode_frames(output_path, frame_queue, stop_event, errors, fps=30):
+    video_out = None
     try:
-        height, width, _ = frames[0].shape
-        video_out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-        for frame in frames:
+        while True:
+            frame = _queue_get(frame_queue, stop_event)
+            if frame is _END_OF_STREAM:
+                break
+            if video_out is None:
+                height, width = frame.shape[:2]
+                video_out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
             video_out.write(frame)
-        video_out.release()
+    except PipelineAborted:
+        pass
     except Exception as e:
-        logging.error(f"An error occurred while reassembling video: {str(e)}")
-        raise
+        logging.error(f"An error occurred while encoding frames: {str(e)}")
+        errors.append(e)
+        stop_event.set()
+    finally:
+        if video_out is not None:
+            video_out.release()
+
+def process_video_stream(video_path, output_path, process_frame, fps=30, queue_size=STREAM_QUEUE_SIZE):
+    decoded = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+    decoder = threading.Thread(target=decode_frames, args=(video_path, decoded, stop_event, errors), daemon=True)
+    encoder = threading.Thread(target=encode_frames, args=(output_path, processed, stop_event, errors, fps), daemon=True)
+    decoder.start()
+    encoder.start()
+
+    frame_count = 0
+    completed = False
+    try:
+        while True:
+            frame = _queue_get(decoded, stop_event)
+            if frame is _END_OF_STREAM:
+                _queue_put(processed, _END_OF_STREAM, stop_event)
+                break
+            _queue_put(processed, process_frame(frame), stop_event)
+            frame_count += 1
+        completed = True
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        logging.error(f"An error occurred while processing frames: {str(e)}")
+        errors.append(e)
+    finally:
+        if not completed:
+            stop_event.set()
+        decoder.join()
+        encoder.join()
+
+    if errors:
+        raise errors[0]
+    if frame_count == 0:
+        raise Exception(f"No frames could be decoded from video file: {video_path}")
+    return frame_count
 
 def extract_zip(zip_path, extract_to):
     try:
@@ -149,12 +227,10 @@ def blur_specific_person_in_video():
 
         logging.info("Video downloaded successfully")
 
-        logging.info("Extracting frames from video")
-        frames = extract_frames(video_path)
-        logging.info("Detecting and blurring the specific person in frames")
-        blurred_frames = [detect_and_blur_specific_person(frame, known_encodings) for frame in frames]
-        logging.info("Reassembling video from blurred frames")
-        reassemble_video(blurred_frames, output_path)
+        logging.info("Streaming frames through specific person detection and blurring")
+        frame_count = process_video_stream(video_path, output_path,
+                                           lambda frame: detect_and_blur_specific_person(frame, known_encodings))
+        logging.info(f"Processed {frame_count} frames")
 
         if source_type in ['youtube', 'vimeo']:
             os.remove(video_path)
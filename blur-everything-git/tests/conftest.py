@@ -0,0 +1,15 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='session')
+def app():
+    # Imported by its real name from a directory on sys.path, so spawned
+    # worker processes can import it too.
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    return importlib.import_module('all-of-it')
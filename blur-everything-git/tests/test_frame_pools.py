@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+import pytest
+
+def write_video(path, size, frames=12):
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 30, size)
+    for _ in range(frames):
+        writer.write(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+    writer.release()
+    return path
+
+def read_frames(path):
+    capture = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            return frames
+        frames.append(frame)
+
+@pytest.fixture
+def pools(app, monkeypatch):
+    monkeypatch.setattr(app, '_idle_frame_pools', app.deque())
+    yield app._idle_frame_pools
+    app._close_idle_frame_pools()
+
+def blur(app, video, output, workers, cancel_event=None):
+    options = app.parse_stream_options({'encoder': 'opencv'})
+    app.process_video_stream(str(video), str(output), 'eyes', None, options, workers=workers, batch_size=4,
+                             cancel_event=cancel_event)
+    return output
+
+def test_pool_is_reused_between_streams(app, pools, tmp_path):
+    video = write_video(tmp_path / 'in.mp4', (160, 120))
+    blur(app, video, tmp_path / 'first.mp4', 2)
+    assert len(pools) == 1
+    pool = pools[0]
+    parallel = read_frames(blur(app, video, tmp_path / 'second.mp4', 2))
+    assert list(pools) == [pool]
+    serial = read_frames(blur(app, video, tmp_path / 'serial.mp4', 1))
+    assert len(parallel) == len(serial) == 12
+    assert all(np.array_equal(a, b) for a, b in zip(parallel, serial))
+
+def test_larger_frames_replace_the_pool(app, pools, tmp_path):
+    blur(app, write_video(tmp_path / 'small.mp4', (160, 120)), tmp_path / 'small_out.mp4', 2)
+    small = pools[0]
+    blur(app, write_video(tmp_path / 'large.mp4', (320, 240)), tmp_path / 'large_out.mp4', 2)
+    assert len(pools) == 1 and pools[0] is not small
+    assert pools[0].slots[0].size >= 320 * 240 * 3 * 4
+
+def test_cancelled_stream_discards_its_pool(app, pools, tmp_path):
+    cancel_event = app.threading.Event()
+    cancel_event.set()
+    with pytest.raises(app.JobCancelled):
+        blur(app, write_video(tmp_path / 'in.mp4', (160, 120)), tmp_path / 'out.mp4', 2, cancel_event)
+    assert len(pools) == 0
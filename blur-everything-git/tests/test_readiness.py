@@ -0,0 +1,31 @@
+def test_ready_after_lazy_loading(app, monkeypatch):
+    monkeypatch.setattr(app, '_warm_up_state', {"ready": False, "error": None, "started": True})
+    monkeypatch.setattr(app, '_loaded_model_names', set())
+    client = app.app.test_client()
+    assert client.get('/ready').status_code == 503
+
+    app._loaded_model_names.update(app._model_loaders)
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is True
+
+
+def test_first_probe_starts_warm_up(app, monkeypatch):
+    monkeypatch.setattr(app, '_warm_up_state', {"ready": False, "error": None, "started": False})
+    monkeypatch.setattr(app, '_loaded_model_names', set())
+    calls = []
+    monkeypatch.setattr(app, 'warm_up_models', lambda: calls.append(1) or False)
+    client = app.app.test_client()
+    assert client.get('/ready').status_code == 503
+    for _ in range(100):
+        if calls and not app._warm_up_state["started"]:
+            break
+        app.time.sleep(0.01)
+    assert calls == [1]
+    # The failed warm-up is started again by the next probe.
+    client.get('/ready')
+    for _ in range(100):
+        if len(calls) == 2:
+            break
+        app.time.sleep(0.01)
+    assert calls == [1, 1]
@@ -0,0 +1,41 @@
+import fitz
+
+def make_pdf(lines):
+    doc = fitz.open()
+    page = doc.new_page()
+    for i, line in enumerate(lines):
+        page.insert_text((72, 72 + 20 * i), line, fontsize=11)
+    return doc
+
+def redacted_text(app, tmp_path, lines, targets):
+    output_path = str(tmp_path / 'out.pdf')
+    app.redact_text_in_pdf(make_pdf(lines), output_path, targets)
+    with fitz.open(output_path) as doc:
+        return doc[0].get_text()
+
+def test_targets_inside_punctuated_words_are_redacted(app, tmp_path):
+    text = redacted_text(app, tmp_path,
+                         ["Signed by John/Mary for Acme-based clients.",
+                          "Contact john@acme.com or Dr.Smith today."],
+                         ["John", "Mary", "Acme", "Smith"])
+    for target in ("john", "mary", "acme", "smith"):
+        assert target not in text.casefold()
+    for kept in ("Signed", "based", "clients", "Contact", "com", "today"):
+        assert kept in text
+
+def test_multi_word_targets_and_possessives(app, tmp_path):
+    text = redacted_text(app, tmp_path,
+                         ["Mary Smith's report was reviewed by Mary.", "Only Smith stays."],
+                         ["Mary Smith"])
+    assert "Mary Smith" not in text
+    assert "reviewed by Mary" in text
+    assert "Only Smith stays" in text
+
+def test_page_targets_only_apply_to_their_pages(app, tmp_path):
+    doc = make_pdf(["John was here."])
+    doc.new_page().insert_text((72, 72), "John was there.", fontsize=11)
+    output_path = str(tmp_path / 'out.pdf')
+    assert app.redact_text_in_pdf(doc, output_path, {"John": [1]}) == 1
+    with fitz.open(output_path) as out:
+        assert "John" in out[0].get_text()
+        assert "John" not in out[1].get_text()
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize('field', ['kernel', 'eye_mode', 'encoder'])
+@pytest.mark.parametrize('value', [['gaussian'], {'name': 'gaussian'}, 3])
+def test_non_string_choice_is_rejected(app, field, value):
+    client = app.app.test_client()
+    response = client.post('/blur-eyes', json={'type': 'local', 'path/url': 'video.mp4', field: value})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith(f"Invalid {field}: ")
+
+
+def test_choices_keep_their_defaults(app):
+    options = app.parse_stream_options({})
+    assert options['kernel'] == app.ANONYMIZE_KERNEL
+    assert options['eye_mode'] == app.EYE_MODE
+    assert options['encoder'] == app.VIDEO_ENCODER
@@ -0,0 +1,166 @@
+import http.server
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+FRAMES = 40
+SIZE = (320, 240)
+
+def write_video(path):
+    # Noise makes the samples large and of different sizes, so a frame's
+    # position in the file cannot be guessed from its index.
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 30, SIZE)
+    for _ in range(FRAMES):
+        writer.write(rng.integers(0, 256, (SIZE[1], SIZE[0], 3), dtype=np.uint8))
+    writer.release()
+    return path.read_bytes()
+
+def _boxes(data, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        yield offset, size, box_type
+        offset += size
+
+def _shift_chunk_offsets(data, start, end, delta):
+    for offset, size, box_type in _boxes(data, start, end):
+        if box_type in (b'trak', b'mdia', b'minf', b'stbl'):
+            _shift_chunk_offsets(data, offset + 8, offset + size, delta)
+        elif box_type == b'stco':
+            count = struct.unpack('>I', data[offset + 12:offset + 16])[0]
+            for i in range(count):
+                p = offset + 16 + 4 * i
+                data[p:p + 4] = struct.pack('>I', struct.unpack('>I', data[p:p + 4])[0] + delta)
+
+def make_fast_start(data):
+    # Moves the moov box in front of the media data, as qt-faststart does.
+    data = bytearray(data)
+    boxes = list(_boxes(data, 0, len(data)))
+    offset, size, _ = next(box for box in boxes if box[2] == b'moov')
+    moov = bytearray(data[offset:offset + size])
+    _shift_chunk_offsets(moov, 8, len(moov), len(moov))
+    out = bytearray()
+    for offset, size, box_type in boxes:
+        if box_type == b'mdat':
+            out += moov
+        if box_type != b'moov':
+            out += data[offset:offset + size]
+    return bytes(out)
+
+class VideoServer:
+    # Serves files from memory in small, throttled pieces and honours Range
+    # requests. A file registered with drop_after closes the first connection
+    # after that many bytes.
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                data, drop_after = server.files[self.path]
+                range_header = self.headers.get('Range')
+                server.requests.append((self.path, range_header))
+                start = int(range_header.split('=')[1].split('-')[0]) if range_header else 0
+                if range_header:
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{len(data) - 1}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(data) - start))
+                self.end_headers()
+                for i in range(start, len(data), 8192):
+                    if drop_after is not None and not range_header and i >= drop_after:
+                        self.close_connection = True
+                        return
+                    self.wfile.write(data[i:i + 8192])
+                    time.sleep(0.002)
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def add(self, name, data, drop_after=None):
+        self.files[f"/{name}"] = (data, drop_after)
+        return f"http://127.0.0.1:{self.httpd.server_port}/{name}"
+
+@pytest.fixture
+def server():
+    server = VideoServer()
+    yield server
+    server.httpd.shutdown()
+
+@pytest.fixture
+def video_data(tmp_path):
+    return write_video(tmp_path / 'source.mp4')
+
+@pytest.fixture(autouse=True)
+def workspace(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'WORKSPACE_ROOT', str(tmp_path / 'work'))
+    # Decode right behind the download instead of 4 MiB behind it.
+    monkeypatch.setattr(app, 'DOWNLOAD_READ_MARGIN', 0)
+
+def blur_remote_video(app, url):
+    return app.run_video_job('eyes', None, 'vimeo', url, 'out.mp4', {'encoder': 'opencv'})
+
+def read_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def assert_same_as_local(app, tmp_path, data, output_file):
+    # Every frame, in order: the output matches blurring the complete file.
+    path = tmp_path / 'complete.mp4'
+    path.write_bytes(data)
+    expected = read_frames(app.run_video_job('eyes', None, 'local', str(path), 'local.mp4',
+                                             {'encoder': 'opencv'})["output_file"])
+    frames = read_frames(output_file)
+    assert len(expected) == FRAMES
+    assert len(frames) == FRAMES
+    assert all(np.array_equal(a, b) for a, b in zip(frames, expected))
+
+@pytest.mark.parametrize('fast_start', [False, True])
+def test_every_frame_in_order(app, server, tmp_path, video_data, fast_start):
+    data = make_fast_start(video_data) if fast_start else video_data
+    result = blur_remote_video(app, server.add('video.mp4', data))
+    assert result["stats"]["frames"] == FRAMES
+    assert_same_as_local(app, tmp_path, data, result["output_file"])
+
+def test_fast_start_layout_and_sample_table(app, tmp_path, video_data):
+    path = tmp_path / 'fast.mp4'
+    path.write_bytes(make_fast_start(video_data))
+    start, end = app.mp4_media_layout(str(path))
+    assert end == path.stat().st_size
+    sample_ends = app.mp4_video_sample_ends(str(path), start)
+    assert len(sample_ends) == FRAMES
+    assert sample_ends[-1] == end
+    assert app.mp4_media_layout(str(tmp_path / 'source.mp4')) is False
+
+def test_dropped_connection_resumes_from_offset(app, server, tmp_path, video_data):
+    data = make_fast_start(video_data)
+    drop_after = len(data) // 3
+    result = blur_remote_video(app, server.add('video.mp4', data, drop_after=drop_after))
+    assert_same_as_local(app, tmp_path, data, result["output_file"])
+    assert len(server.requests) == 2
+    resumed_at = int(server.requests[1][1].split('=')[1].rstrip('-'))
+    assert 0 < resumed_at <= drop_after
+
+def test_fewer_frames_than_index_fails(app, server, video_data):
+    data = make_fast_start(video_data)
+    with pytest.raises(Exception, match=r"Decoded only \d+ of 40 frames"):
+        blur_remote_video(app, server.add('video.mp4', data[:len(data) * 2 // 3]))